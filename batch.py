@@ -0,0 +1,186 @@
+"""Headless batch renaming from a manifest.
+
+    python batch.py month_end.csv --workers 8 --report month_end_report.csv
+
+The manifest is a CSV with a header row, or a JSON list of objects, with
+the columns source, year, project, sequence. source is relative to the
+source share (ori_dir) unless absolute. Each row is filed under the same
+D{year}{project}{sequence}[-R###] name the dialog would give it; a row whose
+bytes are already filed under that drawing number is reported as a
+duplicate of the existing file instead of becoming a new revision.
+"""
+import argparse
+import configparser
+import csv
+import json
+import os
+import time
+
+from copy_engine import VERIFY_DEFAULT, VERIFY_MODES, CopyCancelled, format_rate
+from engine import Engine
+from revisions import drawing_number
+import timing
+
+REPORT_FIELDS = ["row", "source", "dst", "status", "bytes", "seconds", "error"]
+
+
+def read_manifest(path):
+    # list of dicts; CSV values stay strings, drawing_number() validates them
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError(f"{path}: expected a JSON list of rows")
+        return rows
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _describe(e):
+    if isinstance(e, KeyError):
+        return f"missing column {e}"
+    return f"{type(e).__name__}: {e}"
+
+
+def plan(rows, engine, dedup=True):
+    """Reserve a destination for every valid row, in manifest order.
+
+    Reserving up front keeps -R### numbers in manifest order even though
+    the copies finish in any order. With dedup, rows already filed are
+    marked "duplicate" instead. Returns (results, jobs): one result dict
+    per row, and (result, source path) for the rows to copy.
+    """
+    results, todo = [], []
+    for i, row in enumerate(rows, 1):
+        r = {"row": i, "source": row.get("source", ""), "dst": "", "status": "pending",
+             "bytes": 0, "seconds": 0.0, "error": ""}
+        results.append(r)
+        try:
+            src = os.path.join(engine.ori_dir, row["source"])
+            number = drawing_number(row["year"], row["project"], row["sequence"])
+            if not os.path.isfile(src):
+                raise FileNotFoundError(f"No such source file: {src}")
+            ext = os.path.splitext(src)[1]
+            existing = dedup and engine.find_existing(src, number, ext)
+        except (KeyError, ValueError, OSError) as e:
+            r["status"], r["error"] = "error", _describe(e)
+            continue
+        if existing:
+            r["status"], r["dst"] = "duplicate", existing
+            continue
+        todo.append((r, src, number, ext))
+
+    jobs = []
+    reserved = engine.reserve_many([(number, ext) for _, _, number, ext in todo])
+    for (r, src, _, _), dst in zip(todo, reserved):
+        if isinstance(dst, OSError):
+            r["status"], r["error"] = "error", _describe(dst)
+            continue
+        r["dst"] = dst
+        jobs.append((r, src))
+    return results, jobs
+
+
+def run_batch(rows, engine, workers=4, on_result=None, dedup=True):
+    """Copy every manifest row into engine.dst_dir on a pool of `workers` threads.
+
+    The destination is listed once; rows are reserved in order and then
+    copied in parallel by engine.copy_many. on_result(result) is called on
+    the calling thread for each row as it finishes. Returns (results, summary).
+    """
+    t0 = time.perf_counter()
+    results, jobs = plan(rows, engine, dedup)
+    if on_result:
+        for r in results:
+            if r["status"] != "pending":
+                on_result(r)
+
+    def copied(i, res):
+        r = jobs[i][0]
+        r["bytes"], r["seconds"] = res.bytes, res.seconds
+        if res.error is None:
+            r["status"] = "ok"
+        elif isinstance(res.error, CopyCancelled):
+            r["status"] = "cancelled"
+        else:
+            r["status"], r["error"] = "error", _describe(res.error)
+        if on_result:
+            on_result(r)
+
+    engine.copy_many([(src, r["dst"]) for r, src in jobs], workers, copied)
+    return results, summarize(results, time.perf_counter() - t0)
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if r["status"] == "ok"]
+    duplicates = sum(r["status"] == "duplicate" for r in results)
+    total = sum(r["bytes"] for r in ok)
+    elapsed = max(elapsed, 1e-9)
+    return {"rows": len(results), "ok": len(ok), "duplicates": duplicates,
+            "failed": len(results) - len(ok) - duplicates, "bytes": total, "seconds": elapsed,
+            "files_per_sec": len(ok) / elapsed, "bytes_per_sec": total / elapsed}
+
+
+def write_report(results, summary, path):
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "rows": results}, f, indent=2)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        w.writeheader()
+        for r in results:
+            w.writerow({**r, "seconds": f"{r['seconds']:.3f}"})
+
+
+def print_result(r):
+    line = f"row {r['row']:>4} {r['status']:<9} {r['source']}"
+    if r["status"] == "ok":
+        line += f" -> {r['dst']} ({format_rate(r['bytes'] / max(r['seconds'], 1e-9))})"
+    elif r["status"] == "duplicate":
+        line += f": already filed as {r['dst']}"
+    elif r["error"]:
+        line += f": {r['error']}"
+    print(line, flush=True)
+
+
+def main(argv=None):
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    timing.configure(config)
+
+    parser = argparse.ArgumentParser(description="Rename and file scans listed in a manifest")
+    parser.add_argument("manifest", help="CSV or JSON with source, year, project, sequence")
+    parser.add_argument("--dst", default=config.get('network', 'dst_dir', fallback=None),
+                        help="destination directory (default: dst_dir from config.ini)")
+    parser.add_argument("--src-dir", default=config.get('network', 'ori_dir', fallback=""),
+                        help="directory relative source paths are resolved against")
+    parser.add_argument("--workers", type=int,
+                        default=config.getint('batch', 'workers', fallback=4))
+    parser.add_argument("--chunk-mb", type=int,
+                        default=config.getint('copy', 'chunk_mb', fallback=8))
+    parser.add_argument("--verify", choices=VERIFY_MODES,
+                        default=config.get('copy', 'verify', fallback=VERIFY_DEFAULT))
+    parser.add_argument("--report", help="write per-row results to this .csv or .json")
+    args = parser.parse_args(argv)
+    if not args.dst:
+        parser.error("no destination: pass --dst or set dst_dir in config.ini")
+
+    rows = read_manifest(args.manifest)
+    engine = Engine(args.src_dir, [args.dst], chunk_size=args.chunk_mb * 1024 * 1024,
+                    verify=args.verify)
+    try:
+        results, summary = run_batch(rows, engine, args.workers, on_result=print_result)
+    finally:
+        engine.close()
+    if args.report:
+        write_report(results, summary, args.report)
+    print(f"{summary['ok']}/{summary['rows']} files ({summary['duplicates']} already filed), "
+          f"{summary['bytes'] / (1024 * 1024):.1f} MB in {summary['seconds']:.2f}s: "
+          f"{summary['files_per_sec']:.1f} files/s, {format_rate(summary['bytes_per_sec'])} "
+          f"({args.workers} workers)")
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
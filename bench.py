@@ -0,0 +1,860 @@
+import argparse
+import builtins
+import contextlib
+import errno
+import json
+import multiprocessing
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import copy_engine
+import preview
+from batch import run_batch
+from drawing_index import DrawingIndex
+from engine import Engine
+from local_cache import cache_dir
+from copy_engine import copy_file, fan_out_copy, file_digest, format_rate
+from netdrive import DriveMapper
+from revisions import RevisionIndex, reserve, revision_name
+from sidebar import SidebarModel
+from source_index import FileEntry, SourceIndex
+from slowfs import Share, SlowShares
+from staging import StagingCache
+
+
+# --- Synthetic directories ---
+def make_source_dir(root, count, size=1024):
+    os.makedirs(root, exist_ok=True)
+    payload = b"\0" * size
+    now = time.time()
+    for i in range(count):
+        fp = os.path.join(root, f"scan_{i:06}.pdf")
+        with open(fp, "wb") as f:
+            f.write(payload)
+        os.utime(fp, (now - i, now - i))
+    return root
+
+
+def make_large_file(path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return path
+
+
+def parse_sizes(text):
+    # "64K,1M,8M" -> [65536, 1048576, 8388608]
+    units = {"K": 1024, "M": 1024 * 1024}
+    sizes = []
+    for part in text.split(","):
+        part = part.strip().upper()
+        mult = units.get(part[-1], 1)
+        sizes.append(int(part.rstrip("KM")) * mult)
+    return sizes
+
+
+def discard(path):
+    # copy benchmarks start each run without a destination: shutil.copy2
+    # truncates an existing file in place while copy_file replaces it, and
+    # only the latter would pay for unlinking the previous copy
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def timed(fn, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()   # untimed
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+# --- Listing: listdir + isfile + getmtime vs. single scandir pass ---
+def legacy_listing(ori_dir):
+    files = [os.path.join(ori_dir, f) for f in os.listdir(ori_dir)
+             if os.path.isfile(os.path.join(ori_dir, f))]
+    latest = max(files, key=os.path.getmtime)
+    return files, latest
+
+
+def index_listing(ori_dir):
+    index = SourceIndex.scan(ori_dir)
+    return SidebarModel(index.entries), index.latest()
+
+
+def bench_listing(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        src = make_source_dir(os.path.join(tmp, "Level3"), args.files)
+        old = timed(lambda: legacy_listing(src), args.repeat)
+        new = timed(lambda: index_listing(src), args.repeat)
+        print(f"files={args.files}")
+        print(f"listdir+isfile+getmtime: {old * 1000:8.2f} ms")
+        print(f"scandir index:           {new * 1000:8.2f} ms  ({old / new:.1f}x)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Concurrent confirms: many workstations reserving the same drawing ---
+def _confirm_worker(dst_dir, worker, confirms, barrier):
+    # every worker starts from the same (soon stale) listing, like operators
+    # who all opened the dialog before anyone confirmed
+    index = RevisionIndex.scan(dst_dir)
+    barrier.wait()
+    for n in range(confirms):
+        path = reserve(index, "D22501480001", ".pdf")
+        with open(path, "wb") as f:
+            f.write(f"{worker}:{n}".encode())
+
+
+def bench_reserve(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        barrier = multiprocessing.Barrier(args.workers)
+        procs = [multiprocessing.Process(target=_confirm_worker,
+                                         args=(tmp, w, args.confirms, barrier))
+                 for w in range(args.workers)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        dt = time.perf_counter() - t0
+
+        expected = args.workers * args.confirms
+        names = os.listdir(tmp)
+        payloads = set()
+        for n in names:
+            with open(os.path.join(tmp, n), "rb") as f:
+                payloads.add(f.read())
+        failed = [p.exitcode for p in procs if p.exitcode]
+        ok = not failed and len(names) == expected and len(payloads) == expected
+        print(f"workers={args.workers} confirms/worker={args.confirms} "
+              f"files={len(names)} unique payloads={len(payloads)} time={dt:.2f}s")
+        print("OK: no revision was handed out twice" if ok else
+              f"FAIL: expected {expected} distinct files, worker exit codes {failed}")
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Copy throughput: shutil.copy2 vs. chunked engine at several buffer sizes ---
+def bench_copy(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        src = make_large_file(os.path.join(tmp, "drawing.pdf"), args.size_mb)
+        dst = os.path.join(tmp, "out.pdf")
+        mb = args.size_mb
+
+        def report(label, dt):
+            print(f"{label:<24} {dt * 1000:9.1f} ms  {mb / dt:8.1f} MB/s")
+
+        fresh = lambda: discard(dst)
+        report("shutil.copy2", timed(lambda: shutil.copy2(src, dst), args.repeat, fresh))
+        for size in parse_sizes(args.chunks):
+            dt = timed(lambda: copy_file(src, dst, chunk_size=size), args.repeat, fresh)
+            report(f"copy_file chunk={size // 1024}K", dt)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Kernel-side copy vs. buffered loop: wall time and CPU ---
+def cpu_timed(fn):
+    t0, c0 = time.perf_counter(), os.times()
+    fn()
+    t1, c1 = time.perf_counter(), os.times()
+    return t1 - t0, c1.user - c0.user, c1.system - c0.system
+
+
+def bench_zerocopy(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    try:
+        src = make_large_file(os.path.join(tmp, "drawing.pdf"), args.size_mb)
+        dst = os.path.join(tmp, "out.pdf")
+        mb = args.size_mb
+        cases = [
+            ("shutil.copy2", lambda: shutil.copy2(src, dst)),
+            ("buffered loop", lambda: copy_file(src, dst, kernel=False)),
+            ("kernel copy", lambda: copy_file(src, dst, kernel=True)),
+        ]
+        print(f"{'':<16} {'wall ms':>9} {'MB/s':>8} {'user ms':>8} {'sys ms':>8}")
+        for label, fn in cases:
+            runs = []
+            for _ in range(args.repeat):
+                discard(dst)   # untimed
+                runs.append(cpu_timed(fn))
+            wall, user, system = min(runs)
+            print(f"{label:<16} {wall * 1000:9.1f} {mb / wall:8.1f} "
+                  f"{user * 1000:8.1f} {system * 1000:8.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Verification: inline hash and .part checks vs. an unchecked copy ---
+def bench_verify(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    try:
+        src = make_large_file(os.path.join(tmp, "drawing.pdf"), args.size_mb)
+        dst = os.path.join(tmp, "out.pdf")
+        mb = args.size_mb
+        cases = [
+            ("unchecked", dict(verify="none")),
+            ("size", dict(verify="size")),
+            ("size + inline hash", dict(verify="size", on_digest=lambda d: None)),
+            ("hash re-read", dict(verify="hash")),
+        ]
+        print(f"size={mb} MB (buffered loop throughout)")
+        # the first copy creates dst; every timed run then replaces it alike
+        copy_file(src, dst, kernel=False, verify="none")
+        base = None
+        for label, kw in cases:
+            dt = timed(lambda: copy_file(src, dst, kernel=False, **kw), args.repeat)
+            base = base or dt
+            print(f"{label:<20} {dt * 1000:9.1f} ms  {mb / dt:8.1f} MB/s  "
+                  f"{(dt / base - 1) * 100:+6.1f}%")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Resume: injected mid-transfer drops, resumed vs. restarted copies ---
+class FlakyWriter:
+    """A .part file whose writes fail once per offset in faults["at"].
+
+    Half of the chunk crossing the offset is written before EIO is raised,
+    like an SMB session dropping mid-request, and the link stays down for
+    the next stat of the .part (faults["down"]). faults["sent"] counts every
+    byte handed to the share.
+    """
+
+    def __init__(self, f, faults):
+        self.f = f
+        self.faults = faults
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def write(self, data):
+        pos = self.f.tell()
+        at = self.faults["at"]
+        if at and pos + len(data) > at[0]:
+            keep = (at.pop(0) - pos) // 2
+            self.f.write(data[:keep])
+            self.faults["sent"] += keep
+            self.faults["down"] = True
+            raise OSError(errno.EIO, "injected network drop", self.f.name)
+        self.faults["sent"] += len(data)
+        return self.f.write(data)
+
+
+def inject_faults(offsets):
+    # route copy_engine's .part writes through FlakyWriter and fail the first
+    # stat of the .part after each drop; returns the state (undo_faults())
+    faults = {"at": sorted(offsets), "sent": 0, "down": False}
+    real_stat = os.stat
+
+    def flaky_open(path, mode="r", *a, **kw):
+        f = builtins.open(path, mode, *a, **kw)
+        if str(path).endswith(".part") and mode != "rb":
+            faults["down"] = False   # reopened: the link is back
+            return FlakyWriter(f, faults)
+        return f
+
+    def flaky_stat(path, *a, **kw):
+        if faults["down"] and str(path).endswith(".part"):
+            faults["down"] = False
+            raise OSError(errno.EIO, "injected network drop", path)
+        return real_stat(path, *a, **kw)
+    copy_engine.open = flaky_open
+    os.stat = flaky_stat
+    faults["undo"] = lambda: setattr(os, "stat", real_stat)
+    return faults
+
+
+def bench_resume(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    saved = copy_engine.BACKOFF_BASE
+    copy_engine.BACKOFF_BASE = args.backoff
+    try:
+        src = make_large_file(os.path.join(tmp, "drawing.pdf"), args.size_mb)
+        size = os.path.getsize(src)
+        want = file_digest(src)
+        offsets = [int(size * float(f)) for f in args.faults.split(",")]
+
+        def resumed(dst):
+            copy_file(src, dst, kernel=False, verify="hash", resume=len(offsets))
+
+        def restarted(dst):
+            # the old behaviour: every drop throws the partial file away
+            while True:
+                try:
+                    return copy_file(src, dst, kernel=False, verify="hash", resume=0, retries=0)
+                except OSError:
+                    time.sleep(args.backoff)
+
+        print(f"size={args.size_mb} MB drops at {args.faults} of the file")
+        ok = True
+        for label, fn in (("restart from zero", restarted), ("resume from .part", resumed)):
+            dst = os.path.join(tmp, label.split()[0] + ".pdf")
+            faults = inject_faults(offsets)
+            t0 = time.perf_counter()
+            try:
+                fn(dst)
+            finally:
+                faults["undo"]()
+            dt = time.perf_counter() - t0
+            good = file_digest(dst) == want
+            ok = ok and good
+            print(f"{label:<18} {dt * 1000:9.1f} ms  sent {faults['sent'] / size:5.2f}x the file  "
+                  f"{'content OK' if good else 'CONTENT MISMATCH'}")
+        return 0 if ok else 1
+    finally:
+        del copy_engine.open
+        copy_engine.BACKOFF_BASE = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Fan-out: one read to N destinations vs. N sequential copies ---
+def bench_fanout(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        src = make_large_file(os.path.join(tmp, "drawing.pdf"), args.size_mb)
+        dsts = []
+        for i in range(args.dests):
+            os.makedirs(os.path.join(tmp, f"dst{i}"))
+            dsts.append(os.path.join(tmp, f"dst{i}", "out.pdf"))
+
+        def sequential():
+            for d in dsts:
+                copy_file(src, d, kernel=False)
+
+        seq = timed(sequential, args.repeat)
+        fan = timed(lambda: fan_out_copy(src, dsts), args.repeat)
+        print(f"size={args.size_mb} MB dests={args.dests}")
+        print(f"sequential copies: {seq * 1000:9.1f} ms")
+        print(f"fan-out copy:      {fan * 1000:9.1f} ms  ({seq / fan:.2f}x)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Drive mapping: stubbed `net use` with a per-call delay ---
+class StubNetUse:
+    """Runner for DriveMapper that keeps mappings in a dict and sleeps `delay` per call."""
+
+    def __init__(self, delay, mapped=None):
+        self.delay = delay
+        self.mapped = dict(mapped or {})
+        self.calls = 0
+
+    def __call__(self, cmd, timeout):
+        self.calls += 1
+        time.sleep(min(self.delay, timeout))
+        if self.delay > timeout:
+            return None, f"timed out after {timeout}s"
+        if len(cmd) == 2:
+            rows = [f"OK           {d}        {r}" for d, r in self.mapped.items()]
+            return 0, "\n".join(rows)
+        if "/delete" in cmd:
+            self.mapped.pop(cmd[2], None)
+        else:
+            self.mapped[cmd[2]] = cmd[3]
+        return 0, "The command completed successfully."
+
+
+def bench_drives(args):
+    drives = [(f"{chr(ord('A') + i)}:", rf"\\10.0.0.{i}\Share Folder\DWG", "user", "pwd")
+              for i in range(args.drives)]
+    print(f"drives={args.drives} net use delay={args.delay * 1000:.0f} ms")
+    stub = StubNetUse(args.delay)
+    t0 = time.perf_counter()
+    for d in drives:
+        stub(["net", "use", d[0], d[1], d[3], "/user:" + d[2]], args.timeout)
+    print(f"sequential net use:   {(time.perf_counter() - t0) * 1000:8.1f} ms  {stub.calls} calls")
+    stub = StubNetUse(args.delay)
+    for label in ("DriveMapper, cold:", "DriveMapper, mapped:"):
+        calls = stub.calls
+        t0 = time.perf_counter()
+        errors = DriveMapper(stub, args.timeout).map_all(drives)
+        print(f"{label:<21} {(time.perf_counter() - t0) * 1000:8.1f} ms  {stub.calls - calls} calls"
+              f"  errors={sum(e is not None for e in errors.values())}")
+
+
+# --- Startup: per-phase wall time of a front-end up to its first paint ---
+STARTUP_CONFIG = """[network]
+ori_dir = {src}
+dst_dir = {dst}
+merge_dir = {dst}
+
+[credentials]
+username =
+pwd_a =
+pwd_b =
+"""
+
+
+def bench_startup(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        src = make_source_dir(os.path.join(tmp, "Level3"), args.files)
+        dst = os.path.join(tmp, "DWG")
+        os.makedirs(dst)
+        with open(os.path.join(tmp, "config.ini"), "w") as f:
+            f.write(STARTUP_CONFIG.format(src=src, dst=dst))
+        report = os.path.join(tmp, "startup.json")
+        env = dict(os.environ, PPC_CACHE_DIR=os.path.join(tmp, "cache"), PPC_STARTUP_REPORT=report)
+        here = os.path.dirname(os.path.abspath(__file__))
+        cmd = shlex.split(args.cmd) if args.cmd else [sys.executable, os.path.join(here, "renaming4.py")]
+
+        print(f"files={args.files}  {' '.join(cmd)}")
+        header = None
+        for run in range(args.runs):
+            if os.path.exists(report):
+                os.remove(report)
+            t0 = time.time()
+            proc = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True,
+                                  timeout=args.timeout)
+            exited = time.time()
+            if not os.path.exists(report):
+                print(f"run {run}: no startup report (exit code {proc.returncode})")
+                print(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "")
+                return 1
+            with open(report) as f:
+                marks = json.load(f)["marks"]
+            times = [t0] + [t for _, t in marks]
+            cols = [(p, (times[i + 1] - times[i]) * 1000) for i, (p, _) in enumerate(marks)]
+            if header is None:
+                header = "".join(f"{p:>15}" for p, _ in cols)
+                print(f"{'':<10}{header}{'total':>10}{'exit':>8}")
+            # run 0 has no snapshot or caches yet; later runs start warm
+            label = "cold" if run == 0 else f"warm {run}"
+            print(f"{label:<10}" + "".join(f"{ms:13.1f}ms" for _, ms in cols)
+                  + f"{(marks[-1][1] - t0) * 1000:8.1f}ms{(exited - marks[-1][1]) * 1000:6.0f}ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Sidebar model: build and type-to-filter at Level3 scale ---
+def bench_sidebar(args):
+    rnd = random.Random(1)
+    now = time.time()
+    entries = []
+    for i in range(args.files):
+        name = f"SCAN_{rnd.randint(0, 10 ** 8):08}_{i}.pdf"
+        entries.append(FileEntry(os.path.join("Level3", name), name, 1024, now - rnd.random() * 1e7))
+    t0 = time.perf_counter()
+    model = SidebarModel(entries)
+    print(f"files={args.files} build: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    query = ""
+    for ch in args.query:
+        query += ch
+        t0 = time.perf_counter()
+        model.set_filter(query)
+        print(f"filter {query!r:<12} {len(model):6} rows  {(time.perf_counter() - t0) * 1000:6.2f} ms")
+
+
+# --- Batch: manifest throughput against the worker count ---
+def bench_batch(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    try:
+        src = os.path.join(tmp, "src")
+        os.makedirs(src)
+        for i in range(args.files):
+            make_large_file(os.path.join(src, f"scan_{i:04}.pdf"), args.size_mb)
+        rows = [{"source": f"scan_{i:04}.pdf", "year": 2025, "project": 1, "sequence": i + 1}
+                for i in range(args.files)]
+        print(f"files={args.files} size={args.size_mb} MB")
+        for workers in (int(w) for w in args.workers.split(",")):
+            dst = os.path.join(tmp, f"dst{workers}")
+            os.makedirs(dst)
+            _, s = run_batch(rows, Engine(src, [dst]), workers, dedup=False)
+            print(f"workers={workers:<3} {s['seconds'] * 1000:9.1f} ms  "
+                  f"{s['files_per_sec']:7.1f} files/s  {format_rate(s['bytes_per_sec'])}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Drawing index: next-sequence lookups against a large share ---
+def bench_drawings(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_")
+    try:
+        rng = random.Random(1)
+        names = [f"D225{rng.randrange(args.projects):04}{rng.randrange(1, 10000):04}"
+                 + (f"-R{rng.randrange(1, 5):03}" if rng.random() < 0.3 else "")
+                 + rng.choice((".pdf", ".dwg")) for _ in range(args.files)]
+        index = DrawingIndex(tmp, os.path.join(tmp, "drawings.sqlite"))
+        t0 = time.perf_counter()
+        index.sync(names)
+        first = time.perf_counter() - t0
+        names[: args.files // 100] = [n.replace("D225", "D226") for n in names[: args.files // 100]]
+        t0 = time.perf_counter()
+        added, removed = index.sync(names)
+        again = time.perf_counter() - t0
+        projects = [f"{rng.randrange(args.projects):04}" for _ in range(1000)]
+        t_next = timed(lambda: [index.next_sequence("225", p) for p in projects], 3) / len(projects)
+        t_revs = timed(lambda: [index.revisions("225", p, "0042") for p in projects], 3) / len(projects)
+        print(f"drawings={len(index)} projects={args.projects}")
+        print(f"first sync       {first * 1000:9.1f} ms")
+        print(f"incremental sync {again * 1000:9.1f} ms  (+{added} -{removed})")
+        print(f"next_sequence    {t_next * 1e6:9.1f} us")
+        print(f"revisions        {t_revs * 1e6:9.1f} us")
+        index.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Staging: preview + confirm reading the share vs. a staged local copy ---
+def read_all(path):
+    with open(path, "rb") as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+def bench_staging(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    share = tempfile.mkdtemp(prefix="ppc_bench_share_", dir=args.share) if args.share else tmp
+    try:
+        src = make_large_file(os.path.join(share, "drawing.pdf"), args.size_mb)
+        mb = args.size_mb
+        print(f"size={mb} MB share={share}")
+        direct = Engine(share, [os.path.join(tmp, "direct")])
+        staged = Engine(share, [os.path.join(tmp, "staged")],
+                        staging=StagingCache(os.path.join(tmp, "staging")))
+        for engine, label in ((direct, "share"), (staged, "staged")):
+            os.makedirs(engine.dst_dir)
+            t0 = time.perf_counter()
+            engine.stage(src)
+            engine.local(src, wait=True)
+            pulled = time.perf_counter() - t0
+            # preview then confirm, as the dialog does
+            t0 = time.perf_counter()
+            read_all(engine.local(src))
+            preview = time.perf_counter() - t0
+            dst = engine.reserve("D250001", ".pdf")
+            t0 = time.perf_counter()
+            engine.copy(src, dst)
+            confirm = time.perf_counter() - t0
+            # staged: the pull is the only read of the share
+            share_reads = 1 if engine.local(src) != src else 2
+            print(f"{label:<7} background {pulled * 1000:8.1f} ms  preview {preview * 1000:8.1f} ms  "
+                  f"confirm {confirm * 1000:8.1f} ms  share read {share_reads * mb} MB")
+            engine.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if share != tmp:
+            shutil.rmtree(share, ignore_errors=True)
+
+
+# --- Suite: the hot paths against simulated SMB shares, as JSON ---
+SUITE_VERSION = 1
+
+
+def make_dwg_dir(root, drawings, revisions):
+    # drawings D225{project}{seq} with 0-3 revisions each, plus the one the
+    # naming cases file under, with `revisions` revisions
+    os.makedirs(root, exist_ok=True)
+    rnd = random.Random(1)
+    names = [revision_name("D22501480001", r, ".pdf") for r in range(revisions + 1)]
+    for i in range(drawings):
+        dwg = f"D225{rnd.randrange(1, 500):04}{rnd.randrange(2, 10000):04}"
+        names.extend(revision_name(dwg, r, ".pdf") for r in range(rnd.randrange(4)))
+    for n in names:
+        open(os.path.join(root, n), "wb").close()
+    return root
+
+
+def make_pdf(path, pages):
+    # returns None when PyMuPDF is missing: the preview case is skipped
+    try:
+        with contextlib.redirect_stdout(sys.stderr):   # keep --json output clean
+            import fitz
+    except ImportError:
+        return None
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=1190, height=842)   # A3 landscape
+        for y in range(40, 800, 40):
+            page.draw_line((40, y), (1150, y))
+        page.insert_text((60, 60), f"Drawing sheet {i + 1}", fontsize=24)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def legacy_next_name(dst_dir, dwg_number, ext):
+    # the original probe loop: one exists() round trip per revision on file
+    path = os.path.join(dst_dir, dwg_number + ext)
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(dst_dir, f"{dwg_number}-R{counter:03}{ext}")
+        counter += 1
+    return path
+
+
+def suite_cases(level3, dwg, drawing, pdf, scratch):
+    """[(name, fn, reset)]; reset() runs untimed before every run."""
+    listed = {}
+
+    def listed_dwg():
+        listed["index"] = RevisionIndex.scan(dwg)
+
+    def clear_dst():
+        for n in os.listdir(scratch):
+            os.remove(os.path.join(scratch, n))
+
+    staging = StagingCache(cache_dir("staging"))   # local disk
+    engine = Engine(level3, [scratch], staging=staging)
+
+    def staged():
+        clear_dst()
+        shutil.rmtree(staging.root)
+        os.makedirs(staging.root)
+        staging.size = 0
+        engine.stage(drawing)
+        engine.local(drawing, wait=True)
+
+    def first_page():
+        cache = preview.PageCache(64 * 1024 * 1024)
+        preview.Prefetcher(cache)._prefetch(pdf, None)
+
+    cases = [
+        ("listing/legacy", lambda: legacy_listing(level3), None),
+        ("listing/scandir", lambda: index_listing(level3), None),
+        ("naming/legacy-exists-loop", lambda: legacy_next_name(dwg, "D22501480001", ".pdf"), None),
+        ("naming/list-and-index", lambda: RevisionIndex.scan(dwg).next_name("D22501480001", ".pdf"),
+         None),
+        ("naming/listed-index", lambda: listed["index"].next_name("D22501480001", ".pdf"),
+         listed_dwg),
+        ("copy/shutil.copy2", lambda: shutil.copy2(drawing, os.path.join(scratch, "out.pdf")),
+         clear_dst),
+        ("copy/copy_file", lambda: copy_file(drawing, os.path.join(scratch, "out.pdf")),
+         clear_dst),
+        ("copy/engine-staged", lambda: engine.copy(drawing, os.path.join(scratch, "out.pdf")),
+         staged),
+    ]
+    if pdf is not None:
+        cases.append(("preview/first-page", first_page, None))
+    return cases, engine
+
+
+def run_case(fn, reset, repeat, shares):
+    runs, calls, moved = [], None, None
+    for _ in range(repeat):
+        if reset:
+            reset()
+        before = [(s.calls, s.bytes) for s in shares]
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+        if calls is None:
+            # round trips and bytes of one run (they don't vary run to run)
+            calls = sum(s.calls - c for s, (c, _) in zip(shares, before))
+            moved = sum(s.bytes - b for s, (_, b) in zip(shares, before))
+    runs.sort()
+    return {"seconds": runs[0], "median": runs[len(runs) // 2], "runs": runs,
+            "round_trips": calls, "bytes": moved}
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() or None
+
+
+def bench_suite(args):
+    tmp = tempfile.mkdtemp(prefix="ppc_bench_", dir=args.dir)
+    log = sys.stderr if args.json else sys.stdout   # stdout carries the JSON
+    saved_cache = os.environ.get("PPC_CACHE_DIR")
+    os.environ["PPC_CACHE_DIR"] = os.path.join(tmp, "cache")
+    try:
+        # two servers, like ori_dir and dst_dir: Level3 on one, DWG (listed
+        # by the naming cases) and a folder the copies land in on the other
+        level3 = make_source_dir(os.path.join(tmp, "srv-a", "Level3"), args.files)
+        drawing = make_large_file(os.path.join(level3, "drawing.pdf"), args.size_mb)
+        pdf = make_pdf(os.path.join(level3, "sheet.pdf"), args.pages)
+        dwg = make_dwg_dir(os.path.join(tmp, "srv-b", "DWG"), args.drawings, args.revisions)
+        scratch = os.path.join(tmp, "srv-b", "out")
+        os.makedirs(scratch)
+        bandwidth = args.bandwidth_mbit * 1000 * 1000 / 8
+        latency = args.latency_ms / 1000
+        shares = [Share(os.path.join(tmp, srv), latency, bandwidth) for srv in ("srv-a", "srv-b")]
+        print(f"files={args.files} drawings={args.drawings} size={args.size_mb} MB "
+              f"latency={args.latency_ms} ms bandwidth={args.bandwidth_mbit} Mbit/s", file=log)
+
+        results = []
+        with SlowShares(shares):
+            cases, engine = suite_cases(level3, dwg, drawing, pdf, scratch)
+            for name, fn, reset in cases:
+                if args.only and not any(name.startswith(p) for p in args.only.split(",")):
+                    continue
+                result = {"name": name, **run_case(fn, reset, args.repeat, shares)}
+                results.append(result)
+                print(f"{name:<28} {result['seconds'] * 1000:10.1f} ms  "
+                      f"{result['round_trips']:7} round trips  {result['bytes'] / 1e6:8.1f} MB",
+                      file=log)
+            engine.close()
+        if pdf is None:
+            print("preview/first-page skipped: PyMuPDF is not installed", file=log)
+
+        report = {
+            "suite": "ppc-bench", "version": SUITE_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_revision(), "python": sys.version.split()[0], "platform": sys.platform,
+            "params": {"files": args.files, "drawings": args.drawings, "revisions": args.revisions,
+                       "size_mb": args.size_mb, "pages": args.pages, "repeat": args.repeat,
+                       "latency_ms": args.latency_ms, "bandwidth_mbit": args.bandwidth_mbit},
+            "results": results,
+        }
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=1)
+        if args.json:
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        if args.compare:
+            compare_reports(args.compare, report, log)
+    finally:
+        if saved_cache is None:
+            del os.environ["PPC_CACHE_DIR"]
+        else:
+            os.environ["PPC_CACHE_DIR"] = saved_cache
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare_reports(path, report, log=sys.stdout):
+    # best-run change against an earlier --out file, case by case
+    with open(path, encoding="utf-8") as f:
+        old = {r["name"]: r for r in json.load(f)["results"]}
+    for r in report["results"]:
+        before = old.get(r["name"])
+        if before is None:
+            continue
+        change = (r["seconds"] / before["seconds"] - 1) * 100 if before["seconds"] else 0.0
+        print(f"{r['name']:<28} {before['seconds'] * 1000:10.1f} -> {r['seconds'] * 1000:10.1f} ms"
+              f"  {change:+7.1f}%", file=log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PPC hot-path benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("listing", help="source directory listing")
+    p.add_argument("--files", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_listing)
+
+    p = sub.add_parser("reserve", help="multi-process -R### reservation stress test")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--confirms", type=int, default=50)
+    p.set_defaults(func=bench_reserve)
+
+    p = sub.add_parser("copy", help="copy throughput vs. shutil.copy2")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--chunks", default="64K,1M,8M,32M")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_copy)
+
+    p = sub.add_parser("zerocopy", help="copy_file_range/sendfile vs. buffered copy")
+    p.add_argument("--size-mb", type=int, default=512)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--dir", default=None, help="directory on the filesystem to test")
+    p.set_defaults(func=bench_zerocopy)
+
+    p = sub.add_parser("fanout", help="single-read fan-out vs. sequential copies")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--dests", type=int, default=2)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_fanout)
+
+    p = sub.add_parser("verify", help="cost of copy verification modes")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--dir", default=None, help="directory on the filesystem to test")
+    p.set_defaults(func=bench_verify)
+
+    p = sub.add_parser("resume", help="fault injection: resumed vs. restarted copies")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--faults", default="0.3,0.6,0.9", help="drop points as fractions of the file")
+    p.add_argument("--backoff", type=float, default=0.05, help="BACKOFF_BASE for the run")
+    p.add_argument("--dir", default=None, help="directory on the filesystem to test")
+    p.set_defaults(func=bench_resume)
+
+    p = sub.add_parser("drives", help="drive mapping against a stubbed net use")
+    p.add_argument("--drives", type=int, default=2)
+    p.add_argument("--delay", type=float, default=1.0, help="seconds per net use call")
+    p.add_argument("--timeout", type=float, default=15.0)
+    p.set_defaults(func=bench_drives)
+
+    p = sub.add_parser("startup", help="front-end startup phases up to first paint")
+    p.add_argument("--files", type=int, default=5000)
+    p.add_argument("--runs", type=int, default=4)
+    p.add_argument("--cmd", default=None,
+                   help="command to start (default: this python on renaming4.py), e.g. dist\\renaming\\renaming.exe")
+    p.add_argument("--timeout", type=float, default=120)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("sidebar", help="sidebar model build and type-to-filter")
+    p.add_argument("--files", type=int, default=50000)
+    p.add_argument("--query", default="1234")
+    p.set_defaults(func=bench_sidebar)
+
+    p = sub.add_parser("batch", help="batch manifest throughput by worker count")
+    p.add_argument("--files", type=int, default=64)
+    p.add_argument("--size-mb", type=int, default=4)
+    p.add_argument("--workers", default="1,2,4,8")
+    p.add_argument("--dir", default=None, help="directory on the filesystem to test")
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("drawings", help="drawing index sync and next-sequence lookups")
+    p.add_argument("--files", type=int, default=200000)
+    p.add_argument("--projects", type=int, default=500)
+    p.set_defaults(func=bench_drawings)
+
+    p = sub.add_parser("suite", help="listing, naming, copy and preview over simulated SMB shares")
+    p.add_argument("--files", type=int, default=2000, help="files in the synthetic Level3")
+    p.add_argument("--drawings", type=int, default=2000, help="drawing numbers in the synthetic DWG")
+    p.add_argument("--revisions", type=int, default=20, help="revisions of the drawing being filed")
+    p.add_argument("--size-mb", type=int, default=8, help="size of the copied drawing")
+    p.add_argument("--pages", type=int, default=4, help="pages of the previewed PDF")
+    p.add_argument("--latency-ms", type=float, default=1.0, help="per round trip")
+    p.add_argument("--bandwidth-mbit", type=float, default=100.0, help="per share link, 0 = unlimited")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--only", default=None, help="comma-separated case name prefixes")
+    p.add_argument("--json", action="store_true", help="print the JSON report instead of the table")
+    p.add_argument("--out", default=None, help="also write the JSON report here")
+    p.add_argument("--compare", default=None, help="earlier --out report to diff against")
+    p.add_argument("--dir", default=None, help="where to build the synthetic shares")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("staging", help="preview + confirm from the share vs. a staged copy")
+    p.add_argument("--size-mb", type=int, default=64)
+    p.add_argument("--dir", default=None, help="local directory (staging, destinations)")
+    p.add_argument("--share", default=None, help="directory on the share to read from")
+    p.set_defaults(func=bench_staging)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from copy_engine import HASH, file_digest
+from local_cache import cache_file
+
+MAX_ENTRIES = 100000   # oldest-used digests are dropped past this on save
+
+
+def content_index_path():
+    return cache_file("content", HASH, ".json")
+
+
+class ContentIndex:
+    """Content digests of files on the shares, persisted in the local cache.
+
+    Keyed by full path and valid while the file keeps the (size, mtime) it
+    had when hashed, so a digest is computed at most once per file version:
+    inline while the copy engine writes it, or on first comparison.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or content_index_path()
+        self.digests = {}   # path -> [size, mtime, hexdigest], least recently used first
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.hashed = 0     # files read to compute a digest (cache misses)
+
+    @classmethod
+    def load(cls, path=None):
+        index = cls(path)
+        try:
+            with open(index.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get("hash") == HASH:
+            index.digests = {p: list(v) for p, v in data.get("digests", {}).items()}
+        return index
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            items = list(self.digests.items())[-MAX_ENTRIES:]
+            self.dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"hash": HASH, "digests": dict(items)}, f)
+        os.replace(tmp, self.path)
+
+    def record(self, path, digest, st=None):
+        # store a digest computed elsewhere (e.g. inline during a copy)
+        st = st or os.stat(path)
+        with self.lock:
+            self.digests.pop(path, None)
+            self.digests[path] = [st.st_size, st.st_mtime, digest]
+            self.dirty = True
+
+    def digest(self, path, st=None):
+        st = st or os.stat(path)
+        with self.lock:
+            known = self.digests.pop(path, None)
+            if known is not None and (known[0], known[1]) == (st.st_size, st.st_mtime):
+                self.digests[path] = known
+                return known[2]
+        digest = file_digest(path)
+        self.hashed += 1
+        self.record(path, digest, st)
+        return digest
+
+    def find_duplicate(self, src, candidates):
+        """Return the first of `candidates` with the same bytes as src, or None.
+
+        Sizes are compared first, so only same-size files are ever hashed.
+        """
+        src_st = os.stat(src)
+        src_digest = None
+        for path in candidates:
+            try:
+                st = os.stat(path)
+                if st.st_size != src_st.st_size:
+                    continue
+                src_digest = src_digest or self.digest(src, src_st)
+                if self.digest(path, st) == src_digest:
+                    return path
+            except OSError:
+                continue
+        return None
+
+
+def load_in_background(path=None):
+    """Read the persisted index on a worker thread; returns a Future of ContentIndex."""
+    ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-index-load")
+    fut = ex.submit(ContentIndex.load, path)
+    ex.shutdown(wait=False)
+    return fut
@@ -0,0 +1,430 @@
+import errno
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import time
+
+DEFAULT_CHUNK = 8 * 1024 * 1024   # large reads amortise SMB round trips
+PROGRESS_INTERVAL = 0.1           # seconds between progress callbacks
+HASH = "sha256"                   # digest taken inline while copying
+
+# How the .part file is checked before it replaces dst: "size" is one stat,
+# "hash" also re-reads it and compares with the inline digest of the source.
+VERIFY_MODES = ("none", "size", "hash")
+VERIFY_DEFAULT = "size"
+VERIFY_RETRIES = 2                # fresh attempts after a failed check
+
+# A dropped link mid-copy keeps the .part file and resumes from the bytes
+# already in it, after BACKOFF_BASE * 2**n seconds (capped at BACKOFF_MAX),
+# for up to RESUME_ATTEMPTS tries within RESUME_TIMEOUT seconds of the drop.
+RESUME_ATTEMPTS = 6
+RESUME_TIMEOUT = 120.0
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 15.0
+# errors a share gives while the network is away; anything else (missing
+# source, permissions, disk full) is not worth waiting for
+TRANSIENT_ERRNOS = {errno.EIO, errno.ETIMEDOUT, errno.ECONNRESET, errno.ECONNABORTED,
+                    errno.ENETDOWN, errno.ENETUNREACH, errno.EHOSTUNREACH, errno.EAGAIN,
+                    getattr(errno, "ESTALE", errno.EIO)}
+# ERROR_BAD_NETPATH, _NETWORK_BUSY, _UNEXP_NET_ERR, _NETNAME_DELETED, _SEM_TIMEOUT,
+# _CONNECTION_ABORTED
+TRANSIENT_WINERRORS = {53, 54, 59, 64, 121, 1236}
+
+# Kernel-side copies, tried in order when both files are local/CIFS mounts.
+# Neither exists on Windows, where the buffered loop is always used.
+FAST_METHODS = [m for m in ("copy_file_range", "sendfile") if hasattr(os, m)]
+# errors meaning "this method can't do these two files", not a real I/O error
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                    errno.EPERM, errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)}
+
+
+class CopyCancelled(Exception):
+    pass
+
+
+class VerifyError(OSError):
+    # the bytes that landed in the .part file don't match the source
+    pass
+
+
+def part_path(dst):
+    # data is streamed here and only renamed to dst once complete
+    return dst + ".part"
+
+
+def is_transient(e):
+    if isinstance(e, VerifyError):
+        return False
+    return (getattr(e, "winerror", None) in TRANSIENT_WINERRORS
+            or e.errno in TRANSIENT_ERRNOS)
+
+
+def backoff_delay(failures):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    h = hashlib.new(HASH)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                return h.hexdigest()
+            h.update(view[:n])
+
+
+def _verify(tmp, verify, total, written, digest):
+    if verify == "none":
+        return
+    size = os.stat(tmp).st_size
+    if not size == written == total:
+        raise VerifyError(errno.EIO, f"size mismatch: source {total}, sent {written}, "
+                                     f"written {size} bytes", tmp)
+    if verify == "hash" and file_digest(tmp) != digest:
+        raise VerifyError(errno.EIO, "content hash does not match the source", tmp)
+
+
+def _fast_step(method, infd, outfd, offset, count):
+    if method == "copy_file_range":
+        return os.copy_file_range(infd, outfd, count, offset, offset)
+    return os.sendfile(outfd, infd, offset, count)
+
+
+def _kernel_copy(fsrc, fdst, chunk_size, step):
+    """Copy with the first FAST_METHODS entry that works for these files.
+
+    Returns the method name, or None if none applies and nothing was written
+    (the caller then falls back to the buffered loop).
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for method in FAST_METHODS:
+        try:
+            n = _fast_step(method, infd, outfd, 0, chunk_size)
+        except OSError as e:
+            if e.errno in _FALLBACK_ERRNOS:
+                continue
+            raise
+        if not n:
+            # empty source, or a filesystem that silently copies nothing
+            continue
+        offset = n
+        step(n)
+        while True:
+            n = _fast_step(method, infd, outfd, offset, chunk_size)
+            if not n:
+                return method
+            offset += n
+            step(n)
+    return None
+
+
+def _buffered_copy(fsrc, fdst, chunk_size, step, hasher=None):
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        n = fsrc.readinto(buf)
+        if not n:
+            return "buffered"
+        fdst.write(view[:n])
+        if hasher is not None:
+            hasher.update(view[:n])
+        step(n)
+
+
+def copy_file(src, dst, chunk_size=DEFAULT_CHUNK, progress=None, cancel=None, kernel=True,
+              on_digest=None, verify=VERIFY_DEFAULT, retries=VERIFY_RETRIES,
+              resume=RESUME_ATTEMPTS):
+    """Copy src to dst in chunk_size blocks through a temporary .part file.
+
+    With kernel=True the data is moved by copy_file_range/sendfile where the
+    OS and both filesystems allow it, otherwise by a userspace read/write
+    loop. progress(done, total, bytes_per_sec) is called at most every
+    PROGRESS_INTERVAL seconds and once at the end. Setting the `cancel`
+    threading.Event aborts the copy with CopyCancelled; the partial file is
+    removed and dst is left untouched. Timestamps/mode are copied like
+    shutil.copy2. Returns the number of bytes copied.
+
+    The .part file is checked (see VERIFY_MODES) before it replaces dst; a
+    mismatch starts the copy over up to `retries` times and then raises
+    VerifyError. on_digest(hexdigest) receives the HASH of the copied bytes,
+    taken inline without a second read of src. Hashing needs the userspace
+    loop, so on_digest or verify="hash" turn the kernel path off.
+
+    A transient error (is_transient) keeps the .part file; after a backoff
+    the copy resumes from the bytes already in it, up to `resume` times
+    (0 to fail at once) and RESUME_TIMEOUT seconds after the first drop.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return _copy_once(src, dst, chunk_size, progress, cancel, kernel, on_digest, verify,
+                              resume)
+        except VerifyError as e:
+            if attempt == retries:
+                raise
+            print(f"Copy of {src} failed verification ({e}), retrying")
+
+
+def _committed(src, fdst, done, hasher):
+    """Bytes of the reopened .part fdst that can be kept: at most `done`.
+
+    A write cut off mid-chunk may have left less on disk than was sent; the
+    digest is then rebuilt from the source up to the new offset. The size
+    comes from the open handle, so it is known whenever the resume can go on.
+    """
+    offset = min(done, os.fstat(fdst.fileno()).st_size)
+    if hasher is not None and offset != done:
+        hasher = hashlib.new(HASH)
+        with open(src, "rb") as f:
+            left = offset
+            while left:
+                chunk = f.read(min(left, 1024 * 1024))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                left -= len(chunk)
+    return offset, hasher
+
+
+def _copy_once(src, dst, chunk_size, progress, cancel, kernel, on_digest, verify, resume):
+    total = os.path.getsize(src)
+    hasher = hashlib.new(HASH) if on_digest or verify == "hash" else None
+    tmp = part_path(dst)
+    done = 0
+    failures = 0
+    deadline = None
+    start = last = time.perf_counter()
+
+    def step(n):
+        nonlocal done, last
+        done += n
+        if cancel is not None and cancel.is_set():
+            raise CopyCancelled(src)
+        now = time.perf_counter()
+        if progress and now - last >= PROGRESS_INTERVAL:
+            last = now
+            progress(done, total, done / max(now - start, 1e-9))
+
+    try:
+        if cancel is not None and cancel.is_set():
+            raise CopyCancelled(src)
+        while True:
+            try:
+                # both files are reopened on a resume: either handle may
+                # belong to the session that dropped
+                with open(src, "rb") as fsrc, open(tmp, "r+b" if done else "wb") as fdst:
+                    if done:
+                        done, hasher = _committed(src, fdst, done, hasher)
+                        fdst.truncate(done)
+                        fdst.seek(done)
+                        fsrc.seek(done)
+                    elif kernel and hasher is None and _kernel_copy(fsrc, fdst, chunk_size, step):
+                        break
+                    _buffered_copy(fsrc, fdst, chunk_size, step, hasher)
+                break
+            except OSError as e:
+                failures += 1
+                now = time.monotonic()
+                deadline = deadline or now + RESUME_TIMEOUT
+                if not is_transient(e) or failures > resume or now >= deadline:
+                    raise
+                delay = min(backoff_delay(failures), deadline - now)
+                print(f"Copy of {src} interrupted at {done} bytes ({e}), "
+                      f"resuming in {delay:.1f}s")
+                if cancel is not None and cancel.wait(delay):
+                    raise CopyCancelled(src)
+                if cancel is None:
+                    time.sleep(delay)
+        digest = hasher.hexdigest() if hasher is not None else None
+        _verify(tmp, verify, total, done, digest)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    if progress:
+        progress(done, total, done / max(time.perf_counter() - start, 1e-9))
+    if on_digest:
+        on_digest(digest)
+    return done
+
+
+# --- Fan-out: one read of the source, streamed to several destinations ---
+FAN_OUT_DEPTH = 4     # chunks buffered per destination before the reader waits
+_EOF = object()
+_ABORT = object()
+
+
+def _fan_out_writer(src, dst, q, results, verify, state):
+    tmp = part_path(dst)
+    fdst = None
+    written = 0
+    try:
+        fdst = open(tmp, "wb")
+    except OSError as e:
+        results[dst] = e
+    # keep draining after a failure so the reader never blocks on this queue
+    while True:
+        chunk = q.get()
+        if chunk is _EOF or chunk is _ABORT:
+            break
+        if results[dst] is None:
+            try:
+                fdst.write(chunk)
+                written += len(chunk)
+            except OSError as e:
+                results[dst] = e
+    try:
+        if fdst is not None:
+            fdst.close()
+        if chunk is _EOF and results[dst] is None:
+            # the reader filled in state before queueing _EOF
+            _verify(tmp, verify, state["total"], written, state["digest"])
+            shutil.copystat(src, tmp)
+            os.replace(tmp, dst)
+            return
+    except OSError as e:
+        results[dst] = e
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
+
+
+def fan_out_copy(src, dsts, chunk_size=DEFAULT_CHUNK, progress=None, cancel=None,
+                 on_digest=None, verify=VERIFY_DEFAULT, retries=VERIFY_RETRIES):
+    """Read src once and stream every chunk to all of `dsts` in parallel.
+
+    Each destination has its own writer thread and .part file, so one slow or
+    failing server does not stop the others and the total time tracks the
+    slowest destination. Returns {dst: None or the exception for that dst};
+    a source read error or cancel (CopyCancelled) applies to every dst.
+    progress, on_digest and verify work as in copy_file; a destination that
+    fails verification is copied again on its own with copy_file.
+    """
+    total = os.path.getsize(src)
+    hasher = hashlib.new(HASH) if on_digest or verify == "hash" else None
+    state = {"total": total, "digest": None}
+    results = {d: None for d in dsts}
+    queues = {d: queue.Queue(maxsize=FAN_OUT_DEPTH) for d in dsts}
+    writers = [threading.Thread(target=_fan_out_writer,
+                                args=(src, d, queues[d], results, verify, state),
+                                name="fan-out-writer", daemon=True) for d in dsts]
+    for t in writers:
+        t.start()
+
+    done = 0
+    start = last = time.perf_counter()
+    end = _EOF
+    try:
+        with open(src, "rb") as fsrc:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise CopyCancelled(src)
+                chunk = fsrc.read(chunk_size)
+                if not chunk:
+                    break
+                for q in queues.values():
+                    q.put(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                done += len(chunk)
+                now = time.perf_counter()
+                if progress and now - last >= PROGRESS_INTERVAL:
+                    last = now
+                    progress(done, total, done / max(now - start, 1e-9))
+        state["digest"] = hasher.hexdigest() if hasher is not None else None
+    except (OSError, CopyCancelled) as e:
+        end = _ABORT
+        for d in dsts:
+            results[d] = e
+    for q in queues.values():
+        q.put(end)
+    for t in writers:
+        t.join()
+    if end is _EOF:
+        if progress:
+            progress(done, total, done / max(time.perf_counter() - start, 1e-9))
+        for d, err in results.items():
+            # writers don't resume; a destination that dropped or failed its
+            # check is copied again on its own
+            if isinstance(err, OSError) and (is_transient(err) or isinstance(err, VerifyError) and retries):
+                print(f"Copy of {src} to {d} failed ({err}), retrying")
+                try:
+                    copy_file(src, d, chunk_size, cancel=cancel, kernel=False,
+                              verify=verify, retries=max(retries - 1, 0))
+                    results[d] = None
+                except (OSError, CopyCancelled) as e:
+                    results[d] = e
+        if on_digest and any(err is None for err in results.values()):
+            on_digest(state["digest"])
+    return results
+
+
+class CopyJob:
+    """Runs copy_file on a worker thread.
+
+    on_progress(done, total, bytes_per_sec) and on_done(error) are called
+    from the worker thread; GUI callers must hop back to Tk themselves.
+    error is None on success, CopyCancelled on cancel, or the raised exception.
+    With digest=True, `self.digest` holds the HASH of the copied bytes by
+    the time on_done runs.
+    """
+
+    def __init__(self, src, dst, chunk_size=DEFAULT_CHUNK, on_progress=None, on_done=None,
+                 verify=VERIFY_DEFAULT, digest=False):
+        self.src = src
+        self.dst = dst
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.verify = verify
+        self.want_digest = digest
+        self.digest = None
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="copy-job", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _on_digest(self, digest):
+        self.digest = digest
+
+    def _copy_kwargs(self):
+        return {"progress": self.on_progress, "cancel": self.cancel_event, "verify": self.verify,
+                "on_digest": self._on_digest if self.want_digest else None}
+
+    def _run(self):
+        error = None
+        try:
+            copy_file(self.src, self.dst, self.chunk_size, **self._copy_kwargs())
+        except BaseException as e:
+            error = e
+        if self.on_done:
+            self.on_done(error)
+
+
+class FanOutJob(CopyJob):
+    """CopyJob for fan_out_copy; `dst` is a list and on_done gets the results dict."""
+
+    def _run(self):
+        try:
+            results = fan_out_copy(self.src, self.dst, self.chunk_size, **self._copy_kwargs())
+        except BaseException as e:
+            results = {d: e for d in self.dst}
+        if self.on_done:
+            self.on_done(results)
+
+
+def format_rate(bytes_per_sec):
+    return f"{bytes_per_sec / (1024 * 1024):.1f} MB/s"
@@ -0,0 +1,118 @@
+import re
+import sqlite3
+import threading
+
+from local_cache import cache_file
+
+# D{year code}{project:04}{seq:04}[-R###]<ext>; older names have a space
+# between project and sequence
+DRAWING_RE = re.compile(r"^D(?P<year>\d{3})(?P<project>\d{4}) ?(?P<seq>\d{4})"
+                        r"(?:-R(?P<rev>\d+))?(?P<ext>\.[^.]*)?$", re.IGNORECASE)
+
+SYNC_BATCH = 5000   # rows written per transaction; lookups wait at most one batch
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS drawings (
+    name    TEXT PRIMARY KEY COLLATE NOCASE,
+    year    TEXT NOT NULL,
+    project TEXT NOT NULL,
+    seq     TEXT NOT NULL,
+    rev     INTEGER NOT NULL,
+    ext     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS drawings_number ON drawings (year, project, seq);
+"""
+
+
+def parse_drawing(name):
+    """(year, project, seq, rev, ext) of a destination file name, or None."""
+    m = DRAWING_RE.match(name)
+    if not m:
+        return None
+    return (m.group("year"), m.group("project"), m.group("seq"),
+            int(m.group("rev") or 0), (m.group("ext") or "").lower())
+
+
+def drawing_index_path(dst_dir):
+    return cache_file("drawings", dst_dir, ".sqlite")
+
+
+class DrawingIndex:
+    """Every drawing number filed in dst_dir, kept in SQLite in the local cache.
+
+    sync() brings it in line with a listing of the share, parsing only the
+    names it has not seen; reserve/release keep it current in between. The
+    (year, project, seq) index answers next_sequence() and revisions() in
+    well under a millisecond whatever the size of the share, and a stale
+    database from the last session answers them before the share is listed.
+    Safe to use from any thread.
+    """
+
+    def __init__(self, dst_dir, path=None):
+        self.dst_dir = dst_dir
+        self.path = path or drawing_index_path(dst_dir)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM drawings").fetchone()[0]
+
+    def sync(self, names):
+        """Match the table to `names`, a full listing of dst_dir; returns (added, removed)."""
+        names = {n.lower(): n for n in names}
+        with self.lock:
+            known = {n.lower() for (n,) in self.db.execute("SELECT name FROM drawings")}
+        added = []
+        for low, n in names.items():
+            parsed = parse_drawing(n) if low not in known else None
+            if parsed is not None:
+                added.append((n, *parsed))
+        removed = [(n,) for n in known if n not in names]
+        # in batches, so a first sync of a large share doesn't hold up the
+        # dialog's lookups for its whole duration
+        for i in range(0, max(len(added), len(removed)), SYNC_BATCH):
+            with self.lock, self.db:
+                self.db.executemany("INSERT OR REPLACE INTO drawings VALUES (?, ?, ?, ?, ?, ?)",
+                                    added[i:i + SYNC_BATCH])
+                self.db.executemany("DELETE FROM drawings WHERE name = ?", removed[i:i + SYNC_BATCH])
+        return len(added), len(removed)
+
+    def record(self, name):
+        parsed = parse_drawing(name)
+        if parsed is None:
+            return
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO drawings VALUES (?, ?, ?, ?, ?, ?)",
+                            (name, *parsed))
+
+    def forget(self, name):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM drawings WHERE name = ?", (name,))
+
+    def next_sequence(self, year, project):
+        """One past the highest sequence filed for year + project ("0001" if none).
+
+        None once 9999 is taken: sequences are four digits.
+        """
+        with self.lock:
+            (seq,) = self.db.execute("SELECT MAX(seq) FROM drawings WHERE year = ? AND project = ?",
+                                     (year, project.zfill(4))).fetchone()
+        nxt = int(seq or 0) + 1
+        return f"{nxt:04}" if nxt <= 9999 else None
+
+    def revisions(self, year, project, seq):
+        """Names already filed under this drawing number, by extension then revision."""
+        with self.lock:
+            rows = self.db.execute("SELECT name FROM drawings WHERE year = ? AND project = ? "
+                                   "AND seq = ? ORDER BY ext, rev",
+                                   (year, project.zfill(4), seq.zfill(4))).fetchall()
+        return [n for (n,) in rows]
+
@@ -0,0 +1,364 @@
+"""Listing, naming, revision and copy logic shared by the front-ends.
+
+Importing this does nothing: drives are mapped by connect(), the shares
+are listed on the first scan_source()/revisions() call, and everything the
+engine learns (source snapshot, destination listings, content digests) is
+kept on the instance so later calls are served from memory. The Tk scripts
+and batch.py are thin clients; bench.py drives it directly.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from content_index import load_in_background
+from drawing_index import DrawingIndex
+from local_cache import cache_dir
+from copy_engine import DEFAULT_CHUNK, VERIFY_DEFAULT, CopyCancelled, CopyJob, FanOutJob, copy_file
+from netdrive import DriveMapper
+from revisions import RevisionIndex, drawing_number, release, reserve, scan_in_background
+from source_index import open_index
+from staging import STAGE_MAX_BYTES, StagingCache
+import timing
+
+# one copy_many() row; error is None on success
+CopyResult = namedtuple("CopyResult", ["src", "dst", "bytes", "seconds", "error"])
+
+
+class Engine:
+    """One source share filed into one or more destination shares.
+
+    dst_dirs[0] is the primary destination and the default for every
+    dst_dir argument. drives are (letter, remote, user, password) tuples
+    for connect(). With a StagingCache, source files passed to stage() are
+    pulled onto local disk ahead of time and read from there by
+    find_existing() and the copies. inline_digest hashes each copy as it is
+    written, for the content index; it keeps copies off the kernel path, so
+    by default a filed copy is hashed only if a later duplicate check needs it.
+    """
+
+    def __init__(self, ori_dir, dst_dirs, chunk_size=DEFAULT_CHUNK, verify=VERIFY_DEFAULT,
+                 drives=(), mapper=None, staging=None, inline_digest=False):
+        self.ori_dir = ori_dir
+        self.dst_dirs = list(dst_dirs)
+        self.chunk_size = chunk_size
+        self.verify = verify
+        self.inline_digest = inline_digest
+        self.drives = list(drives)
+        self.mapper = mapper or DriveMapper()
+        self.connected = None      # Future of the drive mapping
+        self.source = None
+        self.source_stale = False  # source came from the snapshot, not the share
+        self._revisions = {}       # dst_dir -> Future of RevisionIndex
+        self._content = None       # Future of ContentIndex
+        self._drawings = {}        # dst_dir -> DrawingIndex
+        self.staging = staging
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Engine for the [network], [credentials] and [copy] sections of a ConfigParser."""
+        ori_dir = config.get('network', 'ori_dir')
+        dst_dir = config.get('network', 'dst_dir')
+        merge_dir = config.get('network', 'merge_dir')
+        username = config.get('credentials', 'username', fallback='')
+        staging = None
+        if config.getboolean('staging', 'enabled', fallback=True):
+            max_mb = config.getint('staging', 'max_mb', fallback=STAGE_MAX_BYTES // (1024 * 1024))
+            staging = StagingCache(cache_dir('staging'), max_mb * 1024 * 1024)
+        return cls(ori_dir, [dst_dir, merge_dir],
+                   chunk_size=config.getint('copy', 'chunk_mb', fallback=8) * 1024 * 1024,
+                   verify=config.get('copy', 'verify', fallback=VERIFY_DEFAULT),
+                   inline_digest=config.getboolean('copy', 'inline_digest', fallback=False),
+                   drives=[("A:", ori_dir, username, config.get('credentials', 'pwd_a', fallback='')),
+                           ("B:", dst_dir, username, config.get('credentials', 'pwd_b', fallback=''))],
+                   staging=staging)
+
+    @property
+    def dst_dir(self):
+        return self.dst_dirs[0]
+
+    # --- Connection ---
+    def connect(self):
+        """Map the drives on a worker thread (once); returns the Future."""
+        with self.lock:
+            if self.connected is None:
+                self.connected = timing.timed_future(
+                    "drive_mapping", self.mapper.map_in_background(self.drives),
+                    drives=[d[0] for d in self.drives])
+            return self.connected
+
+    def wait_connected(self):
+        # share access waits here; a no-op when connect() was never called
+        if self.connected is not None:
+            self.connected.result()
+
+    # --- Listing ---
+    def scan_source(self, refresh=False):
+        """The SourceIndex of ori_dir.
+
+        The first call opens the local snapshot when there is one (leaving
+        source_stale set until it is revalidated) and scans the share
+        otherwise; refresh=True makes sure the result reflects the share now.
+        """
+        fresh = False
+        if self.source is None:
+            with timing.span("source_listing", root=self.ori_dir) as f:
+                self.source, self.source_stale = open_index(self.ori_dir, wait=self.wait_connected)
+                f.update(files=len(self.source.entries), snapshot=self.source_stale)
+            fresh = not self.source_stale
+        if refresh and not fresh:
+            self.wait_connected()
+            with timing.span("source_revalidate", root=self.ori_dir) as f:
+                self.source.revalidate()
+                f.update(files=len(self.source.entries))
+            self.source_stale = False
+        return self.source
+
+    def revisions(self, dst_dir=None, refresh=False):
+        """Future of the RevisionIndex of dst_dir, listed once on a worker thread."""
+        dst_dir = dst_dir or self.dst_dir
+        with self.lock:
+            fut = self._revisions.get(dst_dir)
+            started = refresh or fut is None
+            if started:
+                fut = self._revisions[dst_dir] = timing.timed_future(
+                    "dst_listing", scan_in_background(dst_dir, wait=self.wait_connected),
+                    dst_dir=dst_dir)
+        if started:
+            # bring the drawing index in line with the listing (off the Tk
+            # thread); outside the lock, as a finished scan runs this at once
+            fut.add_done_callback(lambda f: self._sync_drawings(dst_dir, f))
+        return fut
+
+    def drawings(self, dst_dir=None):
+        """The DrawingIndex of dst_dir, opened from the local cache on first use."""
+        dst_dir = dst_dir or self.dst_dir
+        with self.lock:
+            if dst_dir not in self._drawings:
+                self._drawings[dst_dir] = DrawingIndex(dst_dir)
+            return self._drawings[dst_dir]
+
+    def _sync_drawings(self, dst_dir, fut):
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        names = [n for ns in fut.result().names.values() for n in ns]
+        try:
+            self.drawings(dst_dir).sync(names)
+        except (sqlite3.Error, OSError) as e:   # suggestions just go stale
+            print("Could not update drawing index:", e)
+
+    def scan_destinations(self, refresh=False):
+        """Start listing every destination at once; {dst_dir: Future of RevisionIndex}."""
+        return {d: self.revisions(d, refresh) for d in self.dst_dirs}
+
+    # --- Naming ---
+    drawing_number = staticmethod(drawing_number)
+
+    def next_sequence(self, year, project, dst_dir=None):
+        return self.drawings(dst_dir).next_sequence(year, project)
+
+    def existing_revisions(self, year, project, seq, dst_dir=None):
+        # names already filed under this number, for a warning while typing
+        return self.drawings(dst_dir).revisions(year, project, seq)
+
+    def next_name(self, dwg_number, ext, dst_dir=None):
+        return self.revisions(dst_dir).result().next_name(dwg_number, ext)
+
+    def next_names(self, items, dst_dir=None):
+        """next_name for each (dwg_number, ext) in items, as if filed in that order."""
+        index = self.revisions(dst_dir).result()
+        scratch = RevisionIndex(index.dst_dir)
+        scratch.revs = dict(index.revs)
+        names = []
+        for dwg_number, ext in items:
+            names.append(scratch.next_name(dwg_number, ext))
+            scratch.record(names[-1])
+        return names
+
+    # --- Staging ---
+    def stage(self, paths):
+        """Start pulling source files onto local disk; a no-op without staging."""
+        if self.staging is not None:
+            self.staging.stage(paths)
+
+    def local(self, src, wait=False):
+        """Where to read src from: its staged copy when fresh, else the share."""
+        return self.staging.local(src, wait) if self.staging is not None else src
+
+    # --- Reservation ---
+    @property
+    def content(self):
+        """The ContentIndex, read from the local cache on first use."""
+        with self.lock:
+            if self._content is None:
+                self._content = load_in_background()
+        return self._content.result()
+
+    def preload(self):
+        # start the slow reads (drive mapping, content index) without waiting
+        self.connect()
+        with self.lock:
+            if self._content is None:
+                self._content = load_in_background()
+
+    def find_existing(self, src, dwg_number, ext, dst_dir=None):
+        """The file in dst_dir already holding src's bytes under this number, or None."""
+        index = self.revisions(dst_dir).result()
+        with timing.span("dedup_check", dwg=dwg_number, dst_dir=dst_dir or self.dst_dir) as f:
+            dup = self.content.find_duplicate(self.local(src), index.paths(dwg_number, ext))
+            f.update(duplicate=dup is not None)
+        return dup
+
+    def reserve(self, dwg_number, ext, dst_dir=None):
+        path = reserve(self.revisions(dst_dir).result(), dwg_number, ext)
+        self._record_drawing(path)
+        return path
+
+    def reserve_many(self, items, dst_dir=None):
+        """reserve() each (dwg_number, ext) in order; a path or the OSError per item."""
+        index = self.revisions(dst_dir).result()
+        paths = []
+        for dwg_number, ext in items:
+            try:
+                paths.append(reserve(index, dwg_number, ext))
+                self._record_drawing(paths[-1])
+            except OSError as e:
+                paths.append(e)
+        return paths
+
+    def release(self, path):
+        release(path)
+        dst_dir, name = os.path.split(path)
+        if dst_dir in self._drawings:
+            try:
+                self._drawings[dst_dir].forget(name)
+            except sqlite3.Error:
+                pass
+
+    def _record_drawing(self, path):
+        dst_dir, name = os.path.split(path)
+        try:
+            self.drawings(dst_dir).record(name)
+        except (sqlite3.Error, OSError) as e:
+            print("Could not update drawing index:", e)
+
+    # --- Copy ---
+    def copy(self, src, dst, progress=None, cancel=None):
+        """copy_file src onto a reserved dst (recording its digest if inline_digest); returns bytes copied."""
+        digest = []
+        local = self.local(src)
+        with timing.span("copy", src=src, dst=dst, staged=local != src) as f:
+            f["bytes"] = copy_file(local, dst, self.chunk_size, progress, cancel, verify=self.verify,
+                                   on_digest=digest.append if self.inline_digest else None)
+        if digest:
+            # dst is filed by now: a failed bookkeeping stat must not release it
+            try:
+                self.content.record(dst, digest[0])
+            except OSError:
+                pass
+        return f["bytes"]
+
+    def copy_job(self, src, dsts, on_progress=None, on_done=None):
+        """Start copying src to reserved dsts on a worker thread; returns the job.
+
+        One destination runs a CopyJob, several a FanOutJob reading src once.
+        on_done({dst: None or error}) is called from the worker thread after
+        the digests of the copied files have been recorded (inline_digest). A pull of src
+        still under way is waited for, so the share is read only once.
+        """
+        job = None
+        started = {"queued": time.perf_counter()}
+
+        def done(outcome):
+            results = outcome if isinstance(outcome, dict) else {dsts[0]: outcome}
+            log_copy(results)
+            for dst, err in results.items():
+                if err is None and job.digest:
+                    try:
+                        self.content.record(dst, job.digest)
+                    except OSError:
+                        pass
+            if on_done:
+                on_done(results)
+
+        def log_copy(results):
+            try:
+                size = os.path.getsize(job.src)
+            except OSError:
+                size = None
+            errors = {d: f"{type(e).__name__}: {e}" for d, e in results.items() if e is not None}
+            timing.record("copy", time.perf_counter() - started["start"], src=src, dst=list(results),
+                          staged=job.src != src, bytes=size and size * (len(results) - len(errors)),
+                          waited_for_pull=round(started["start"] - started["queued"], 6),
+                          **({"error": errors} if errors else {}))
+
+        def start():
+            started["start"] = time.perf_counter()
+            job.src = self.local(src)
+            return job.start()
+
+        cls = CopyJob if len(dsts) == 1 else FanOutJob
+        job = cls(src, dsts[0] if len(dsts) == 1 else list(dsts), self.chunk_size,
+                  on_progress, done, self.verify, digest=self.inline_digest)
+        pull = self.staging.pending_for(src) if self.staging is not None else None
+        if pull is None:
+            return start()
+        # falls back to the share if the pull failed or was dropped
+        pull.add_done_callback(lambda _: start())
+        return job
+
+    def _copy_one(self, src, dst, cancel):
+        t0 = time.perf_counter()
+        try:
+            n, err = self.copy(src, dst, cancel=cancel), None
+        except (OSError, CopyCancelled) as e:
+            self.release(dst)
+            n, err = 0, e
+        return CopyResult(src, dst, n, time.perf_counter() - t0, err)
+
+    def copy_many(self, pairs, workers=4, on_result=None):
+        """copy() each (src, reserved dst) on a pool of `workers` threads.
+
+        Returns a CopyResult per pair, in order; failed copies have their
+        reservation released. on_result(i, result) runs on the calling
+        thread as each copy finishes. Ctrl-C cancels the running copies,
+        releases every unfinished reservation and re-raises.
+        """
+        results = [None] * len(pairs)
+        cancel = threading.Event()
+        ex = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="engine-copy")
+        try:
+            futures = {ex.submit(self._copy_one, src, dst, cancel): i
+                       for i, (src, dst) in enumerate(pairs)}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                results[i] = fut.result()
+                if on_result:
+                    on_result(i, results[i])
+        except KeyboardInterrupt:
+            # running copies stop with CopyCancelled and release themselves;
+            # queued ones never start
+            cancel.set()
+            ex.shutdown(wait=True, cancel_futures=True)
+            for fut, i in futures.items():
+                if fut.cancelled():
+                    self.release(pairs[i][1])
+            raise
+        finally:
+            ex.shutdown(wait=True)
+        return results
+
+    def close(self):
+        # persist what was learned this session
+        if self.staging is not None:
+            self.staging.shutdown()
+        for drawings in self._drawings.values():
+            drawings.close()
+        if self._content is not None and self._content.done():
+            try:
+                self._content.result().save()
+            except OSError as e:
+                print("Could not save content index:", e)
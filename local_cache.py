@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+
+def cache_dir(*parts):
+    """Return (and create) a per-user local cache directory for PPC data."""
+    base = os.environ.get("PPC_CACHE_DIR")
+    if not base:
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(base, "PPC")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_file(kind, key, ext):
+    # one file per (kind, key); key is usually a UNC path, so hash it
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(kind), f"{digest}{ext}")
+
+
+def evict_lru(root, size, max_bytes, stamp="st_mtime", keep=None):
+    """Remove the least recently used files in root until size is 10% under max_bytes.
+
+    size is the caller's running total of root; returns it after eviction.
+    stamp is the stat field that records use. Files still being written
+    (.part, .tmp) and `keep` are left alone.
+    """
+    with os.scandir(root) as it:
+        files = sorted((getattr(e.stat(), stamp), e.stat().st_size, e.path) for e in it
+                       if e.is_file() and e.path != keep and not e.name.endswith((".part", ".tmp")))
+    for _, n, fp in files:
+        if size <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(fp)
+            size -= n
+        except OSError:
+            pass
+    return size
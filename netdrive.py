@@ -1,15 +1,106 @@
+import re
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-def map_network_drive_cmd(local_drive, remote_path, username="cantal", password="eYlvK72e"):
-    cmd = ["net", "use", local_drive, remote_path]
-    if username and password:
-        cmd.extend([password, "/user:" + username])
+NET_USE_TIMEOUT = 15   # seconds per `net use` call; an unreachable server can hang far longer
+
+# Status  Local  Remote  [Network]   -- remote paths may contain single spaces
+_NET_USE_LINE = re.compile(r"^(?P<status>\S+)?\s+(?P<local>[A-Za-z]:)\s+(?P<remote>\\\\\S.*?)(?:\s{2,}.*)?$")
+
+
+def run_command(cmd, timeout):
+    """Default runner: returns (returncode, output) of cmd."""
     try:
-        subprocess.run(cmd, check=True)
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, f"timed out after {timeout}s"
+    except OSError as e:
+        return None, str(e)
+    return p.returncode, (p.stdout or "") + (p.stderr or "")
+
+
+def parse_net_use(output):
+    """{"A:": (status, remote)} for each drive letter in `net use` output."""
+    drives = {}
+    for line in output.splitlines():
+        m = _NET_USE_LINE.match(line)
+        if m:
+            drives[m.group("local").upper()] = (m.group("status") or "", m.group("remote").strip())
+    return drives
+
+
+def _same_share(a, b):
+    return a.rstrip("\\").lower() == b.rstrip("\\").lower()
+
+
+class DriveMapper:
+    """Maps network drives with `net use`, skipping ones already in place.
+
+    `runner(cmd, timeout) -> (returncode, output)` executes the commands
+    (returncode None when it could not run or timed out); pass a stub to
+    exercise this without Windows or a network.
+    """
+
+    def __init__(self, runner=run_command, timeout=NET_USE_TIMEOUT):
+        self.runner = runner
+        self.timeout = timeout
+
+    def existing(self):
+        code, out = self.runner(["net", "use"], self.timeout)
+        return parse_net_use(out) if code == 0 else {}
+
+    def map_drive(self, local_drive, remote_path, username=None, password=None, current=None):
+        """Map one drive; returns None on success (or nothing to do), else an error string."""
+        local_drive = local_drive.upper()
+        if current is not None:
+            status, remote = current
+            if not _same_share(remote, remote_path):
+                return f"{local_drive} is already mapped to {remote}"
+            if status.upper() == "OK":
+                return None
+            # ours but disconnected: drop the stale mapping and connect again
+            self.runner(["net", "use", local_drive, "/delete", "/y"], self.timeout)
+        cmd = ["net", "use", local_drive, remote_path]
+        if username and password:
+            cmd.extend([password, "/user:" + username])
+        code, out = self.runner(cmd, self.timeout)
+        if code != 0:
+            return out.strip() or f"net use exited with {code}"
+        return None
+
+    def map_all(self, drives):
+        """Map [(local_drive, remote_path, username, password), ...] concurrently.
+
+        One `net use` listing first, then a thread per drive still missing.
+        Returns {local_drive: None or error string}.
+        """
+        if not drives:
+            return {}
+        current = self.existing()
+        with ThreadPoolExecutor(max_workers=len(drives), thread_name_prefix="net-use") as ex:
+            futures = {d[0].upper(): ex.submit(self.map_drive, *d, current=current.get(d[0].upper()))
+                       for d in drives}
+        results = {drive: f.result() for drive, f in futures.items()}
+        for drive, err in results.items():
+            if err:
+                print(f"Error mapping drive {drive}: {err}")
+        return results
+
+    def map_in_background(self, drives):
+        """Start map_all on a worker thread and return its Future."""
+        ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drive-mapper")
+        fut = ex.submit(self.map_all, drives)
+        ex.shutdown(wait=False)
+        return fut
+
+
+def map_network_drive_cmd(local_drive, remote_path, username="cantal", password="eYlvK72e"):
+    err = DriveMapper().map_all([(local_drive, remote_path, username, password)])[local_drive.upper()]
+    if err is None:
         print(f"Drive {local_drive} successfully mapped to {remote_path}")
-    except subprocess.CalledProcessError as e:
-        print("Error mapping drive:", e)
 
-# Example usage:
-map_network_drive_cmd("Z:", r"\\172.16.20.13\Share Folder\Printer")
-#map_network_drive_cmd("Z:", r"\\172.16.30.120\Share Folder\Printer")
+
+if __name__ == "__main__":
+    # Example usage:
+    map_network_drive_cmd("Z:", r"\\172.16.20.13\Share Folder\Printer")
+    #map_network_drive_cmd("Z:", r"\\172.16.30.120\Share Folder\Printer")
@@ -0,0 +1,450 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import tkinter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from local_cache import evict_lru
+import timing
+
+PREVIEW_DEBOUNCE_MS = 250   # quiet time before a changed selection is rendered
+PAGE_GAP = 10               # pixels between pages on the canvas
+KEEP_PAGES = 2              # PhotoImages kept alive either side of the view
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024   # larger files are not prefetched
+
+# MuPDF is not thread-safe: every fitz call, from any thread, holds this lock
+FITZ_LOCK = threading.Lock()
+
+
+def page_sizes(doc, zoom):
+    return [(p.rect.width * zoom, p.rect.height * zoom) for p in doc]
+
+
+def rasterize(doc, page, zoom):
+    import fitz
+    pix = doc[page].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes("ppm")
+
+
+class Debouncer:
+    """Collapse a burst of calls into one call `delay_ms` after the last."""
+
+    def __init__(self, widget, delay_ms, fn):
+        self.widget = widget
+        self.delay_ms = delay_ms
+        self.fn = fn
+        self.pending = None
+
+    def __call__(self):
+        self.cancel()
+        self.pending = self.widget.after(self.delay_ms, self._fire)
+
+    def cancel(self):
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.pending = None
+
+    def _fire(self):
+        self.pending = None
+        if self.widget.winfo_exists():
+            self.fn()
+
+
+class RenderStats:
+    """Per-session preview counters, printed when the dialog closes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.renders = 0          # files loaded into the viewer
+        self.pages = 0            # pages actually rasterized
+        self.skipped = 0          # render requested for the file already shown
+        self.label_updates = 0    # MO number / file name refreshes
+        self.prefetched = 0       # first pages rendered ahead of selection
+
+    def report(self, cache=None):
+        text = (f"Preview session: {self.renders} files shown, {self.pages} pages "
+                f"rasterized, {self.prefetched} prefetched, {self.skipped} skipped, "
+                f"{self.label_updates} label updates in "
+                f"{time.perf_counter() - self.started:.0f}s")
+        if cache is not None:
+            text += f"; page cache {cache.hits} hits / {cache.misses} misses"
+            if cache.backing is not None:
+                disk = cache.backing
+                text += (f"; disk cache {disk.hits} hits / {disk.misses} misses, "
+                         f"{disk.size / (1024 * 1024):.0f} MB")
+        return text
+
+
+class DiskPageCache:
+    """Rendered pages and page layouts kept on local disk between sessions.
+
+    Keys start with (path, size, mtime) of the source, so a revisited drawing
+    is served without reading the share, and a changed one misses. Files are
+    evicted oldest-used first (mtime is bumped on every hit) once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        with os.scandir(root) as it:
+            self.size = sum(e.stat().st_size for e in it if e.is_file())
+
+    def _file(self, key, ext):
+        return os.path.join(self.root, hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ext)
+
+    def _read(self, fp):
+        try:
+            with open(fp, "rb") as f:
+                data = f.read()
+            os.utime(fp)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def _write(self, fp, data):
+        tmp = fp + ".tmp"
+        try:
+            replaced = os.path.getsize(fp) if os.path.exists(fp) else 0
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, fp)
+        except OSError as e:
+            print("Could not write preview cache:", e)
+            return
+        with self.lock:
+            self.size += len(data) - replaced
+            if self.size > self.max_bytes:
+                self.size = evict_lru(self.root, self.size, self.max_bytes)
+
+    def has(self, key):
+        return os.path.exists(self._file(key, ".ppm"))
+
+    def has_layout(self, doc_key):
+        return os.path.exists(self._file(doc_key, ".json"))
+
+    def get(self, key):
+        return self._read(self._file(key, ".ppm"))
+
+    def put(self, key, data):
+        self._write(self._file(key, ".ppm"), data)
+
+    def get_layout(self, doc_key):
+        data = self._read(self._file(doc_key, ".json"))
+        return json.loads(data) if data else None
+
+    def put_layout(self, doc_key, sizes):
+        self._write(self._file(doc_key, ".json"), json.dumps(sizes).encode("utf-8"))
+
+
+class PageCache:
+    """LRU of rendered pages (PPM bytes) bounded by total size in bytes.
+
+    Keys are (path, size, mtime, page, zoom), so an edited file never hits a
+    stale raster. Misses fall through to `backing` (a DiskPageCache) when
+    given. Safe to use from the render thread and the Tk thread.
+    """
+
+    def __init__(self, max_bytes, backing=None):
+        self.max_bytes = max_bytes
+        self.backing = backing
+        self.items = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.items.get(key)
+            if data is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        if self.backing is not None:
+            data = self.backing.get(key)
+            if data is not None:
+                self._remember(key, data)
+        return data
+
+    def has(self, key):
+        # presence check that doesn't count as a hit or miss
+        with self.lock:
+            if key in self.items:
+                return True
+        return self.backing is not None and self.backing.has(key)
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.backing is not None:
+            self.backing.put(key, data)
+
+    def _remember(self, key, data):
+        with self.lock:
+            if key in self.items:
+                self.size -= len(self.items.pop(key))
+            if len(data) > self.max_bytes:
+                return
+            self.items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, old = self.items.popitem(last=False)
+                self.size -= len(old)
+
+
+class PdfView(tkinter.Frame):
+    """Scrollable PDF preview that rasterizes pages only as they come into view.
+
+    Page 1 is rendered as part of opening the document; further pages are
+    rendered on a single worker thread when scrolled near, and only the
+    pages around the view keep a PhotoImage. Rendered pages go through
+    `cache`; when its disk backing already holds the layout and page 1 the
+    source is not opened at all. `local(path)` names the file actually read
+    (e.g. a staged copy); cache keys always use the share path. Results
+    come back through `ui` (a ui_dispatch.Dispatcher) when given, else
+    through after(). Requires PyMuPDF (fitz), imported on first use.
+    """
+
+    def __init__(self, master, cache, zoom=1.0, stats=None, local=None, ui=None):
+        super().__init__(master)
+        self.cache = cache
+        self.zoom = zoom
+        self.stats = stats or RenderStats()
+        self.local = local or (lambda path: path)
+        self.post = ui.post if ui is not None else (lambda fn: self.after(0, fn))
+
+        self.canvas = tkinter.Canvas(self, bg="grey75", highlightthickness=0)
+        ys = tkinter.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        xs = tkinter.Scrollbar(self, orient="horizontal", command=self.canvas.xview)
+        # every scroll/resize goes through yscrollcommand: use it to render
+        # whatever just came into view
+        self.canvas.config(xscrollcommand=xs.set,
+                           yscrollcommand=lambda *a: (ys.set(*a), self._request_visible()))
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        ys.grid(row=0, column=1, sticky="ns")
+        xs.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.canvas.bind("<MouseWheel>",
+                         lambda e: self.canvas.yview_scroll(int(-e.delta / 120), "units"))
+
+        # one render thread: a fitz document must stay on one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+        self.bind("<Destroy>", lambda e: e.widget is self and self.executor.shutdown(wait=False))
+        self.generation = 0
+        self.key = None        # (path, size, mtime) of the document on screen
+        self.layout = []       # (y0, width, height) per page
+        self.images = {}       # page -> (canvas item, PhotoImage)
+        self.requested = set()
+        self._doc = None       # render-thread only
+        self._doc_key = None
+
+    # --- Tk thread ---
+    def load(self, path, stat=None):
+        """Show `path`; stat=(size, mtime) from the source index saves a stat."""
+        self.generation += 1
+        gen = self.generation
+        self.key = None
+        self.layout, self.images, self.requested = [], {}, set()
+        self.canvas.delete("all")
+        self._status(f"Loading {os.path.basename(path)}...")
+        self.stats.renders += 1
+        fut = self.executor.submit(self._open, gen, path, stat)
+        fut.add_done_callback(lambda f: self.post(lambda: self._opened(gen, path, f)))
+
+    def _opened(self, gen, path, fut):
+        if gen != self.generation or not self.winfo_exists():
+            return
+        self.canvas.delete("status")
+        try:
+            key, sizes, first = fut.result()
+        except ImportError:
+            self._status("PyMuPDF is required for PDF preview.")
+            return
+        except Exception as e:
+            self._status(f"No preview for {os.path.basename(path)}:\n{e}")
+            return
+        self.key = key
+        y = 0
+        for i, (w, h) in enumerate(sizes):
+            self.layout.append((y, w, h))
+            self.canvas.create_rectangle(0, y, w, y + h, fill="white", outline="", tags=f"ph{i}")
+            y += h + PAGE_GAP
+        width = max((w for w, _ in sizes), default=0)
+        self.canvas.config(scrollregion=(0, 0, width, max(y - PAGE_GAP, 0)))
+        if first is not None:
+            self._show(0, first)
+        self._request_visible()
+
+    def _status(self, text):
+        self.canvas.create_text(10, 10, anchor="nw", text=text, tags="status")
+
+    def _visible_pages(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        return [i for i, (y0, _, h) in enumerate(self.layout) if y0 < bottom and y0 + h > top]
+
+    def _request_visible(self):
+        if not self.layout:
+            return
+        visible = self._visible_pages() or [0]
+        lo, hi = min(visible), max(visible)
+        # free PhotoImages that scrolled well out of view (bytes stay cached)
+        for i in [i for i in self.images if i < lo - KEEP_PAGES or i > hi + KEEP_PAGES]:
+            item, _ = self.images.pop(i)
+            self.canvas.delete(item)
+            self.requested.discard(i)
+        # visible pages plus the next one, so scrolling down is seamless
+        for i in range(lo, min(hi + 1, len(self.layout) - 1) + 1):
+            if i in self.images or i in self.requested:
+                continue
+            self.requested.add(i)
+            data = self.cache.get((*self.key, i, self.zoom))
+            if data is not None:
+                self._show(i, data)
+                continue
+            gen = self.generation
+            fut = self.executor.submit(self._render, gen, self.key, i)
+            fut.add_done_callback(
+                lambda f, i=i: self.post(lambda: self._rendered(gen, i, f)))
+
+    def _rendered(self, gen, page, fut):
+        if gen != self.generation or not self.winfo_exists():
+            return
+        try:
+            data = fut.result()
+        except Exception:
+            data = None
+        if data is None:
+            self.requested.discard(page)
+            return
+        self._show(page, data)
+
+    def _show(self, page, data):
+        img = tkinter.PhotoImage(data=data)
+        y0, _, _ = self.layout[page]
+        item = self.canvas.create_image(0, y0, image=img, anchor="nw")
+        self.canvas.delete(f"ph{page}")
+        self.images[page] = (item, img)
+        self.requested.add(page)
+
+    # --- render thread ---
+    def _raster(self, page):
+        import fitz
+        # resolved before taking the lock: local() may wait for a staging pull
+        local = self.local(self._doc_key[0]) if self._doc is None else None
+        with FITZ_LOCK, timing.span("preview_page", file=self._doc_key[0], page=page) as f:
+            if self._doc is None:
+                # layout came from the disk cache; open the source only now
+                self._doc = fitz.open(local)
+            data = rasterize(self._doc, page, self.zoom)
+            f["ppm_bytes"] = len(data)
+        self.cache.put((*self._doc_key, page, self.zoom), data)
+        self.stats.pages += 1
+        return data
+
+    def _open(self, gen, path, stat):
+        if self._doc is not None:
+            with FITZ_LOCK:
+                self._doc.close()
+        self._doc = self._doc_key = None
+        if stat is None:
+            st = os.stat(path)
+            stat = (st.st_size, st.st_mtime)
+        key = (path, *stat)
+        self._doc_key = key
+        disk = self.cache.backing
+        sizes = disk.get_layout((*key, self.zoom)) if disk is not None else None
+        first = self.cache.get((*key, 0, self.zoom))
+        if sizes is not None and (first is not None or not sizes):
+            return key, sizes, first
+        import fitz
+        local = self.local(path)
+        with FITZ_LOCK, timing.span("preview_open", file=path, size=stat[0],
+                                    staged=local != path) as f:
+            self._doc = fitz.open(local)
+            sizes = page_sizes(self._doc, self.zoom)
+            f["pages"] = len(sizes)
+        if disk is not None:
+            disk.put_layout((*key, self.zoom), sizes)
+        if sizes and first is None and gen == self.generation:
+            first = self._raster(0)
+        return key, sizes, first
+
+    def _render(self, gen, key, page):
+        # skip work queued for a file the user already moved away from
+        if gen != self.generation or key != self._doc_key:
+            return None
+        return self._raster(page)
+
+
+class Prefetcher:
+    """Warms the preview cache for files the user is likely to open next.
+
+    Reading the source off the share runs on a small thread pool; the
+    rasterizing of page 1 is serialized through FITZ_LOCK like PdfView.
+    schedule() drops whatever was still queued, so a jump in the selection
+    never leaves the pool busy with stale neighbours.
+    """
+
+    def __init__(self, cache, zoom=1.0, workers=2, stats=None, local=None):
+        self.cache = cache
+        self.zoom = zoom
+        self.stats = stats
+        self.local = local or (lambda path: path)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.pending = []
+
+    def schedule(self, items):
+        """Prefetch [(path, stat or None), ...] in the given priority order."""
+        self.cancel()
+        self.pending = [self.executor.submit(self._prefetch, path, stat) for path, stat in items]
+
+    def cancel(self):
+        for f in self.pending:
+            f.cancel()
+        self.pending = []
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _prefetch(self, path, stat):
+        if stat is None:
+            st = os.stat(path)
+            stat = (st.st_size, st.st_mtime)
+        key = (path, *stat)
+        disk = self.cache.backing
+        if self.cache.has((*key, 0, self.zoom)) and (disk is None or disk.has_layout((*key, self.zoom))):
+            return
+        if stat[0] > PREFETCH_MAX_BYTES:
+            return
+        with open(self.local(path), "rb") as f:
+            data = f.read()
+        import fitz
+        try:
+            with FITZ_LOCK:
+                doc = fitz.open(stream=data, filetype=os.path.splitext(path)[1].lstrip(".") or "pdf")
+                try:
+                    sizes = page_sizes(doc, self.zoom)
+                    first = rasterize(doc, 0, self.zoom) if sizes else None
+                finally:
+                    doc.close()
+        except Exception:
+            return  # not something we can preview
+        if disk is not None:
+            disk.put_layout((*key, self.zoom), sizes)
+        if first is not None:
+            self.cache.put((*key, 0, self.zoom), first)
+            if self.stats is not None:
+                self.stats.prefetched += 1
@@ -1,37 +1,33 @@
 import os
-import shutil
 from tkinter import Tk, Toplevel, Label, Entry, Button, StringVar, messagebox
 from tkinter import ttk  # Import ttk for better themed widgets
-import subprocess
 from datetime import datetime
+import timing
+from engine import Engine
+
+# phase timings to the local log; PPC_PROFILE=cprofile|sample for profiling
+timing.configure()
 
 # --- Existing setup ---
 ori_dir = r"\\172.16.20.13\Share Folder\Level3"
 dst_dir = r"\\172.16.30.120\SVR-Drive\CANSG\DWG"
 merge_dir = r"\\192.168.4.163\SVR-Drive\CANSG\DWG"
 
-def map_network_drive_cmd(local_drive, remote_path, username, password):
-    cmd = ["net", "use", local_drive, remote_path]
-    if username and password:
-        cmd.extend([password, "/user:" + username])
-    try:
-        subprocess.run(cmd, check=True)
-        print(f"Drive {local_drive} successfully mapped to {remote_path}")
-    except subprocess.CalledProcessError as e:
-        print("Error mapping drive:", e)
-
-map_network_drive_cmd("A:", ori_dir , "cantal", "eYlvK72e")
-map_network_drive_cmd("B:", dst_dir, "cantal", "123456")
+engine = Engine(ori_dir, [dst_dir, merge_dir],
+                drives=[("A:", ori_dir, "cantal", "eYlvK72e"),
+                        ("B:", dst_dir, "cantal", "123456")])
+# both drives in parallel; ones already mapped are left alone
+engine.connect()
 
 # --- File Handling ---
-files = [os.path.join(ori_dir, f) for f in os.listdir(ori_dir)
-         if os.path.isfile(os.path.join(ori_dir, f))]
+index = engine.scan_source(refresh=True)
+files = index.paths()
 
 if not files:
     print("No files found in the source directory.")
     exit(1)
 
-latest_file = max(files, key=os.path.getmtime)
+latest_file = index.latest().path
 print(f"Latest file found: {latest_file}")
 
 # --- GUI Setup ---
@@ -106,16 +102,15 @@ dwg_number = f"{prefix}{project}{sequence}"
 
 # --- File Copy with Name Handling ---
 _, file_extension = os.path.splitext(latest_file)
-new_file_name = f"{dwg_number}{file_extension}"
-destination_file_path = os.path.join(dst_dir, new_file_name)
-
-counter = 1
-while os.path.exists(destination_file_path):
-    new_file_name = f"{dwg_number}-R{counter:03}{file_extension}"
-    destination_file_path = os.path.join(dst_dir, new_file_name)
-    counter += 1
-
-shutil.copy2(latest_file, destination_file_path)
+destination_file_path = engine.reserve(dwg_number, file_extension)
+
+try:
+    engine.copy(latest_file, destination_file_path)
+except BaseException:
+    engine.release(destination_file_path)
+    raise
+finally:
+    engine.close()
 print(f"File copied and renamed to: {destination_file_path}")
 
 messagebox.showinfo("File Renamed", f"File copied and renamed to:\n{destination_file_path}")
@@ -1,8 +1,36 @@
 # -*- mode: python ; coding: utf-8 -*-
+#
+#   pyinstaller renaming.spec                      one-file renaming.exe
+#   pyinstaller renaming.spec -- --onedir          dist/renaming/ folder: starts
+#                                                  faster, nothing to unpack per launch
+#   pyinstaller renaming.spec -- --entry renaming4.py
+import argparse
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--onedir", action="store_true")
+parser.add_argument("--entry", default="renaming.py")
+options = parser.parse_args()
+
+# Installed in the dev environment (see requirements.txt) but never used by
+# the renaming tools; listed so no hook or stray import drags them into the
+# bundle that the onefile bootloader unpacks on every launch.
+EXCLUDES = [
+    "numpy", "pandas", "matplotlib", "scipy",
+    "flask", "flask_cors", "fastapi", "starlette", "uvicorn", "pydantic", "pydantic_core",
+    "httpx", "httpcore", "anyio", "requests", "urllib3", "aiofiles", "jinja2", "markupsafe",
+    "lxml", "ezdxf", "fontTools", "fpdf", "docx", "docxtpl", "docxcompose", "docx2pdf",
+    "customtkinter", "darkdetect", "babel", "imageio", "dbfread", "htmltools",
+    "pytest", "unittest", "pydoc", "doctest", "xmlrpc", "lib2to3", "test", "tkinter.test",
+]
+
+# renaming2's preview imports tkPDFViewer (and its PIL dependency) lazily;
+# keep them out of every other front-end's bundle
+with open(options.entry, encoding="utf-8") as f:
+    if "tkPDFViewer" not in f.read():
+        EXCLUDES += ["tkPDFViewer", "PIL"]
 
 a = Analysis(
-    ['renaming.py'],
+    [options.entry],
     pathex=[],
     binaries=[],
     datas=[],
@@ -10,25 +38,21 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
+# UPX-packed DLLs are decompressed on every load (and slow down AV scans),
+# which costs more at startup than it saves on disk
+exe_options = dict(
     name='renaming',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +60,31 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+if options.onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        **exe_options,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='renaming',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        runtime_tmpdir=None,
+        **exe_options,
+    )
@@ -1,75 +1,47 @@
 import os
-import shutil
-import subprocess
 from datetime import datetime
 from tkinter import Tk, Toplevel, Label, Entry, Button, StringVar, messagebox
 from tkinter import ttk
-import threading
 import tkinter
 from tkinter import messagebox
 import configparser
+import timing
+from engine import Engine
+from ui_dispatch import Dispatcher, STALL_MS
 
 # --- Load configuration ---
 config = configparser.ConfigParser()
 config.read('config.ini')
+# phase timings to the local log; [diagnostics] / PPC_PROFILE for profiling
+timing.configure(config)
 
-# Read IP addresses from config
-ori_dir= config.get('network', 'ori_dir')
-dst_dir = config.get('network', 'dst_dir')
-merge_dir = config.get('network', 'merge_dir')
+# shares and credentials from [network] / [credentials]
+engine = Engine.from_config(config)
+ori_dir = engine.ori_dir
+dst_dir, merge_dir = engine.dst_dirs
 
-# credentials
-username = config.get('credentials', 'username')
-pwd_a     = config.get('credentials', 'pwd_a')
-pwd_b     = config.get('credentials', 'pwd_b')
+# both drives in parallel; ones already mapped are left alone
+engine.connect()
 
-def map_network_drive_cmd(local_drive, remote_path, username, password):
-    cmd = ["net", "use", local_drive, remote_path]
-    if username and (pwd_a or pwd_b):
-        cmd.extend([password, "/user:" + username])
-    try:
-        subprocess.run(cmd, check=True)
-        print(f"Drive {local_drive} successfully mapped to {remote_path}")
-    except subprocess.CalledProcessError as e:
-        print("Error mapping drive:", e)
-
-
-<<<<<<< HEAD
-map_network_drive_cmd("A:", ori_dir, username, pwd_a)
-map_network_drive_cmd("B:", dst_dir, username, pwd_b)
-=======
-map_network_drive_cmd("A:", ori_dir, "cantal", "eYlvK72e")
-map_network_drive_cmd("B:", dst_dir, "cantal", "654321")
->>>>>>> c7fff6f345c68f06bd914e7f2d28e77729a00b2c
-
-files = [os.path.join(ori_dir, f) for f in os.listdir(ori_dir)
-         if os.path.isfile(os.path.join(ori_dir, f))]
+index = engine.scan_source(refresh=True)
+files = index.paths()
 if not files:
     messagebox.showerror("No Files Found", "No files found in the source directory.")
     exit(1)
 
-latest_file = max(files, key=os.path.getmtime)
+latest_file = index.latest().path
 print(f"Latest file found: {latest_file}")
+# pull it onto local disk now: the preview and the copy both read it
+engine.stage(latest_file)
 
 # --- Create Main Tkinter Window & Start Mainloop ---
 root = Tk()
 root.withdraw()
 
-# --- Patch PhotoImage for Thread-Safe Creation ---
-from tkinter import PhotoImage as OriginalPhotoImage
-def safe_PhotoImage(*args, **kwargs):
-    if threading.current_thread() != threading.main_thread():
-        event = threading.Event()
-        result = {}
-        def create_image():
-            result["img"] = OriginalPhotoImage(*args, **kwargs)
-            event.set()
-        root.after(0, create_image)
-        event.wait()
-        return result["img"]
-    else:
-        return OriginalPhotoImage(*args, **kwargs)
-tkinter.PhotoImage = safe_PhotoImage
+# --- Worker results reach Tk only through the dispatcher ---
+ui = Dispatcher(root, stall_ms=config.getint('diagnostics', 'stall_ms', fallback=STALL_MS)).start()
+# tkPDFViewer builds its PhotoImages on its own thread; build them on the Tk loop
+tkinter.PhotoImage = ui.main_thread(tkinter.PhotoImage)
 
 # --- Helper Function to Center a Window on Screen ---
 def center_window(window, width, height):
@@ -102,19 +74,11 @@ def get_dwg_input():
     input_frame.pack(pady=(0, 10), anchor="center")
     
     # Configure grid columns so that the inputs are centered.
-<<<<<<< HEAD
     input_frame.grid_columnconfigure(0, weight=0)
     input_frame.grid_columnconfigure(1, weight=1)
     input_frame.grid_columnconfigure(2, weight=0)
     input_frame.grid_columnconfigure(3, weight=1)
     input_frame.grid_columnconfigure(4, weight=0)
-=======
-    input_frame.grid_columnconfigure(0, weight=1)
-    input_frame.grid_columnconfigure(1, weight=1)
-    input_frame.grid_columnconfigure(2, weight=1)
-    input_frame.grid_columnconfigure(3, weight=0)
-    input_frame.grid_columnconfigure(4, weight=1)
->>>>>>> c7fff6f345c68f06bd914e7f2d28e77729a00b2c
 
     # Header row: Labels above each input.
     Label(input_frame, text="Year", font=("TkDefaultFont", 10, "bold"), anchor="center") \
@@ -204,8 +168,19 @@ def get_dwg_input():
         pdf_frame = tkinter.Frame(preview_frame)
         pdf_frame.pack(pady=5)
         viewer = pdf.ShowPdf()
-        pdf_display = viewer.pdf_view(pdf_frame, pdf_location=latest_file, width=120, height=40)
-        pdf_display.pack(anchor="center", pady=5)
+
+        def show_pdf(local):
+            if not pdf_frame.winfo_exists():
+                return
+            # tkPDFViewer reads and renders on its own thread: this times
+            # starting the render
+            with timing.span("preview_start", file=latest_file, staged=local.result() != latest_file):
+                pdf_display = viewer.pdf_view(pdf_frame, pdf_location=local.result(), width=120, height=40)
+            pdf_display.pack(anchor="center", pady=5)
+
+        # picking the staged copy stats the share, so it runs on a worker; it
+        # never waits for the pull (the share is read if it hasn't finished)
+        ui.in_background(engine.local, latest_file, then=show_pdf)
 
         confirm_button = Button(input_frame, text="Confirm", command=on_confirm) 
         confirm_button.grid(row=3, column=1, padx=10, pady=10 , sticky = "e")
@@ -235,7 +210,7 @@ def main_flow():
     mo_data = get_dwg_input()
     if not mo_data:
         messagebox.showerror("Cancelled", "No DWG input received or operation cancelled.")
-        root.destroy()
+        finish()
         return
 
     selected_year, project, sequence = mo_data
@@ -243,18 +218,30 @@ def main_flow():
     prefix = f"D{selected_year}"
     dwg_number = f"{prefix}{project}{sequence}"
     _, file_extension = os.path.splitext(latest_file)
-    new_file_name = f"{dwg_number}{file_extension}"
-    destination_file_path = os.path.join(dst_dir, new_file_name)
-
-    counter = 1
-    while os.path.exists(destination_file_path):
-        new_file_name = f"{dwg_number}-R{counter:03}{file_extension}"
-        destination_file_path = os.path.join(dst_dir, new_file_name)
-        counter += 1
-
-    shutil.copy2(latest_file, destination_file_path)
-    print(f"File copied and renamed to: {destination_file_path}")
-    messagebox.showinfo("File Renamed", f"File copied and renamed to:\n{destination_file_path}")
+    # reserve and copy on a worker so the window keeps repainting
+    ui.in_background(reserve_and_copy, dwg_number, file_extension, then=copied)
+
+def reserve_and_copy(dwg_number, file_extension):
+    destination_file_path = engine.reserve(dwg_number, file_extension)
+    try:
+        engine.copy(latest_file, destination_file_path)
+    except BaseException:
+        engine.release(destination_file_path)
+        raise
+    return destination_file_path
+
+def copied(fut):
+    if fut.exception() is not None:
+        messagebox.showerror("Copy Failed", f"Could not copy the file:\n\n{fut.exception()}")
+    else:
+        destination_file_path = fut.result()
+        print(f"File copied and renamed to: {destination_file_path}")
+        messagebox.showinfo("File Renamed", f"File copied and renamed to:\n{destination_file_path}")
+    finish()
+
+def finish():
+    ui.stop()
+    engine.close()
     root.destroy()
 
 root.after(0, main_flow)
@@ -1,68 +1,53 @@
 import os
-import shutil
-import subprocess
 from datetime import datetime
 from tkinter import Tk, Toplevel, Label, Entry, Button, StringVar, messagebox
 from tkinter import ttk
-import threading
 import tkinter
 import configparser
+import timing
+from engine import Engine
+from copy_engine import CopyCancelled, format_rate
+from local_cache import cache_dir
+from preview import RenderStats, PageCache, DiskPageCache, PdfView
+from ui_dispatch import Dispatcher, STALL_MS
 
 # --- Load configuration ---
 config = configparser.ConfigParser()
 config.read('config.ini')
-
-# Read UNC paths from config
-ori_dir   = config.get('network', 'ori_dir')
-dst_dir   = config.get('network', 'dst_dir')
-merge_dir = config.get('network', 'merge_dir')
-
-# credentials
-username = config.get('credentials', 'username')
-pwd_a     = config.get('credentials', 'pwd_a')
-pwd_b     = config.get('credentials', 'pwd_b')
-
-def map_network_drive_cmd(local_drive, remote_path, username, password):
-    cmd = ["net", "use", local_drive, remote_path]
-    if username and password:
-        cmd.extend([password, "/user:" + username])
-    try:
-        subprocess.run(cmd, check=True)
-        print(f"Drive {local_drive} successfully mapped to {remote_path}")
-    except subprocess.CalledProcessError as e:
-        print("Error mapping drive:", e)
-
-map_network_drive_cmd("A:", ori_dir, username, pwd_a)
-map_network_drive_cmd("B:", dst_dir, username, pwd_b)
-
-files = [os.path.join(ori_dir, f) for f in os.listdir(ori_dir)
-         if os.path.isfile(os.path.join(ori_dir, f))]
+# phase timings to the local log; [diagnostics] / PPC_PROFILE for profiling
+timing.configure(config)
+
+# shares, credentials and copy tuning ([network], [credentials], [copy])
+engine = Engine.from_config(config)
+
+# preview: rendered pages are cached in memory up to cache_mb and on local
+# disk up to disk_cache_mb, so revisited drawings don't touch the share
+preview_zoom = config.getfloat('preview', 'zoom', fallback=1.0)
+page_cache = PageCache(
+    config.getint('preview', 'cache_mb', fallback=256) * 1024 * 1024,
+    DiskPageCache(cache_dir('previews'),
+                  config.getint('preview', 'disk_cache_mb', fallback=1024) * 1024 * 1024))
+
+# both drives in parallel (ones already mapped are left alone); the latest
+# file must come from the share itself, not the snapshot
+engine.connect()
+index = engine.scan_source(refresh=True)
+files = index.paths()
 if not files:
     messagebox.showerror("No Files Found", "No files found in the source directory.")
     exit(1)
 
-latest_file = max(files, key=os.path.getmtime)
+latest_file = index.latest().path
 print(f"Latest file found: {latest_file}")
+# pull it onto local disk now: the preview and the copy both read it
+engine.stage(latest_file)
 
 # --- Create Main Tkinter Window & Start Mainloop ---
 root = Tk()
 root.withdraw()
 
-# --- Patch PhotoImage for Thread-Safe Creation ---
-from tkinter import PhotoImage as OriginalPhotoImage
-def safe_PhotoImage(*args, **kwargs):
-    if threading.current_thread() != threading.main_thread():
-        event = threading.Event()
-        result = {}
-        def create_image():
-            result["img"] = OriginalPhotoImage(*args, **kwargs)
-            event.set()
-        root.after(0, create_image)
-        event.wait()
-        return result["img"]
-    else:
-        return OriginalPhotoImage(*args, **kwargs)
-tkinter.PhotoImage = safe_PhotoImage
+# --- Worker results reach Tk only through the dispatcher ---
+ui = Dispatcher(root, stall_ms=config.getint("diagnostics", "stall_ms", fallback=STALL_MS)).start()
 
 # --- Helper to center a window ---
 def center_window(window, width, height):
@@ -80,6 +65,9 @@ def get_dwg_input():
     top.title("Enter MO Number, Preview & Confirm")
     center_window(top, 1100, 900)
 
+    # list dst_dir once while the user types; on_confirm only looks it up
+    engine.revisions(refresh=True)
+
     main_frame = tkinter.Frame(top)
     main_frame.pack(fill="both", expand=True, padx=20, pady=10)
 
@@ -117,92 +105,163 @@ def get_dwg_input():
     Entry(input_frame, textvariable=seq_var, validate="key",
           validatecommand=vc, width=8).grid(row=1, column=4)
 
+    # next free sequence for the year + project typed so far (click to use
+    # it), and a warning when the number already has files in dst_dir
+    hint_label = Label(input_frame, fg="#555555", cursor="hand2")
+    hint_label.grid(row=2, column=0, columnspan=5, pady=(5,0))
+    hint = {"next": None}
+    hint_label.bind("<Button-1>", lambda e: hint["next"] and seq_var.set(hint["next"]))
+
+    # --- Copy progress, shown under the preview while a copy runs ---
+    progress_frame = tkinter.Frame(main_frame)
+    progress_frame.pack(side="bottom", fill="x")
+    progress_var = tkinter.DoubleVar(top)
+    progress_bar = ttk.Progressbar(progress_frame, variable=progress_var, maximum=100)
+    progress_label = Label(progress_frame, text="")
+    copy_state = {"job": None, "reserving": False, "closing": False}
+
     # --- Preview & Confirm section ---
+    # Built once: typing only retexts the two labels, and the PDF (always
+    # latest_file here) is rendered a single time.
     preview_frame = tkinter.Frame(main_frame)
     preview_frame.pack(fill="both", pady=(10,0), expand=True)
 
-    def build_preview():
-        # Clear previous preview widgets
-        for w in preview_frame.winfo_children():
-            w.destroy()
+    mo_label = Label(preview_frame, font=("TkDefaultFont",12,"bold"))
+    mo_label.pack(pady=5)
+    name_label = Label(preview_frame, font=("TkDefaultFont",10))
+    name_label.pack(pady=5)
+    stats = RenderStats()
+    pdf_view = PdfView(preview_frame, page_cache, zoom=preview_zoom, stats=stats,
+                       local=lambda p: engine.local(p, wait=True), ui=ui)
+    pdf_view.pack(fill="both", expand=True, pady=5)
+
+    # Confirm/Cancel buttons
+    btn_frame = tkinter.Frame(preview_frame)
+    btn_frame.pack(pady=10)
+    Button(btn_frame, text="Confirm", command=lambda: on_confirm())\
+        .grid(row=0, column=0, padx=5)
+    Button(btn_frame, text="Cancel",  command=lambda: on_cancel())\
+        .grid(row=0, column=1, padx=5)
 
-        # MO Number label
+    def update_labels():
         y = year_var.get() or opts[2]
         p = project_var.get().zfill(4)
         s = seq_var.get().zfill(4)
-        Label(preview_frame,
-              text=f"MO Number: {y} - {p} - {s}",
-              font=("TkDefaultFont",12,"bold"))\
-          .pack(pady=5)
-
-        # New file name label
         ext = os.path.splitext(latest_file)[1]
-        newname = f"D{y}{p}{s}{ext}"
-        Label(preview_frame,
-              text=f"New File Name: {newname}",
-              font=("TkDefaultFont",10))\
-          .pack(pady=5)
-
-        # --- PDF Viewer block restored ---
-        try:
-            from tkPDFViewer import tkPDFViewer as pdf
-        except ImportError:
-            messagebox.showerror("Missing Module",
-                                 "tkPDFViewer is required for PDF preview.")
-            top.destroy()
+        mo_label.config(text=f"MO Number: {y} - {p} - {s}")
+        name_label.config(text=f"New File Name: D{y}{p}{s}{ext}")
+        update_hint(y, project_var.get(), seq_var.get())
+        stats.label_updates += 1
+
+    def update_hint(y, p, s):
+        # indexed lookups in the local drawing index: no share access per key
+        if not p:
+            hint["next"] = None
+            hint_label.config(text="")
             return
-
-        pdf_holder = tkinter.Frame(preview_frame)
-        pdf_holder.pack(fill="both", expand=True, pady=5)
-        viewer = pdf.ShowPdf()
-        pdf_widget = viewer.pdf_view(
-            pdf_holder,
-            pdf_location=latest_file,
-            width=120,   # adjust these to taste
-            height=40
-        )
-        pdf_widget.pack(fill="both", expand=True)
-
-        # Confirm/Cancel buttons
-        btn_frame = tkinter.Frame(preview_frame)
-        btn_frame.pack(pady=10)
-        Button(btn_frame, text="Confirm", command=on_confirm)\
-            .grid(row=0, column=0, padx=5)
-        Button(btn_frame, text="Cancel",  command=on_cancel)\
-            .grid(row=0, column=1, padx=5)
+        hint["next"] = engine.next_sequence(y, p)
+        text = (f"Next free sequence for {y}-{p.zfill(4)}: {hint['next']}" if hint['next']
+                else f"No free sequence left for {y}-{p.zfill(4)}")
+        filed = engine.existing_revisions(y, p, s) if s else []
+        if filed:
+            more = f" and {len(filed) - 3} more" if len(filed) > 3 else ""
+            text += f"\nAlready filed: {', '.join(filed[-3:])}{more}"
+        hint_label.config(text=text, fg="#b00000" if filed else "#555555")
 
     def on_confirm():
+        if copy_state["job"] or copy_state["reserving"]:
+            return
         # Read fresh values
         y = year_var.get() or opts[2]
         p = project_var.get().zfill(4)
         s = seq_var.get().zfill(4)
 
         ext = os.path.splitext(latest_file)[1]
-        fn  = f"D{y}{p}{s}{ext}"
-        dest = os.path.join(dst_dir, fn)
-        i = 1
-        while os.path.exists(dest):
-            fn   = f"D{y}{p}{s}-R{i:03}{ext}"
-            dest = os.path.join(dst_dir, fn)
-            i  += 1
-
-        shutil.copy2(latest_file, dest)
-        messagebox.showinfo("File Renamed", f"Copied to:\n{dest}")
-        top.confirmed = True
-        top.destroy()
+        # the duplicate check and reserving list the share: do them on a
+        # worker, continue on the Tk loop
+        copy_state["reserving"] = True
+        ui.in_background(reserve_target, f"D{y}{p}{s}", ext, then=start_copy)
+
+    def reserve_target(dwg_number, ext):
+        # (None, file already holding these bytes) or (reserved path, None)
+        dup = engine.find_existing(latest_file, dwg_number, ext)
+        if dup:
+            return None, dup
+        return engine.reserve(dwg_number, ext), None
+
+    def start_copy(reserved):
+        copy_state["reserving"] = False
+        if copy_state["closing"]:
+            # cancelled while reserving: give the name back, then close
+            dest = None if reserved.exception() else reserved.result()[0]
+            if dest:
+                ui.in_background(engine.release, dest)
+            top.destroy()
+            return
+        if reserved.exception() is not None:
+            messagebox.showerror("Copy Failed", f"Could not reserve a name:\n\n{reserved.exception()}")
+            return
+        dest, existing = reserved.result()
+        if existing:
+            messagebox.showinfo("File Renamed", f"Already filed as:\n{existing}")
+            top.confirmed = True
+            top.destroy()
+            return
+
+        progress_var.set(0)
+        progress_label.config(text="Copying...")
+        progress_bar.pack(fill="x", padx=5, pady=(5,0))
+        progress_label.pack(pady=(0,5))
+        # worker-thread callbacks are posted to the Tk loop
+        copy_state["job"] = engine.copy_job(
+            latest_file, [dest],
+            on_progress=ui.wrap(show_progress),
+            on_done=lambda res: ui.post(copy_finished, dest, res[dest]),
+        )
+
+    def show_progress(done, total, rate):
+        if not top.winfo_exists():
+            return
+        pct = 100.0 * done / total if total else 100.0
+        progress_var.set(pct)
+        progress_label.config(text=f"{pct:.0f}%  ({format_rate(rate)})")
+
+    def copy_finished(dest, error):
+        copy_state["job"] = None
+        if error is None:
+            messagebox.showinfo("File Renamed", f"Copied to:\n{dest}")
+            top.confirmed = True
+            top.destroy()
+            return
+        ui.in_background(engine.release, dest)
+        progress_bar.pack_forget()
+        progress_label.pack_forget()
+        if not isinstance(error, CopyCancelled):
+            messagebox.showerror("Copy Failed", f"Could not copy to:\n{dest}\n\n{error}")
 
     def on_cancel():
+        # first Cancel stops a running copy; otherwise close the dialog
+        if copy_state["job"]:
+            copy_state["job"].cancel()
+            return
+        if copy_state["reserving"]:
+            # close once the reservation is back, so it can be released
+            copy_state["closing"] = True
+            return
         top.destroy()
+    top.protocol("WM_DELETE_WINDOW", on_cancel)
 
     # initial render
-    build_preview()
+    update_labels()
+    pdf_view.load(latest_file)
 
-    # if you want live‑update as you type:
-    project_var.trace_add('write', lambda *a: build_preview())
-    seq_var.trace_add('write',     lambda *a: build_preview())
+    # live-update the labels as you type
+    for var in (year_var, project_var, seq_var):
+        var.trace_add('write', lambda *a: update_labels())
 
     top.grab_set()
     top.wait_window()
+    print(stats.report(page_cache))
     if getattr(top, 'confirmed', False):
         return True
     return None
@@ -213,6 +272,8 @@ def get_dwg_input():
 def main_flow():
     if not get_dwg_input():
         messagebox.showerror("Cancelled", "No DWG input received or operation cancelled.")
+    ui.stop()
+    engine.close()
     root.destroy()
 
 root.after(0, main_flow)
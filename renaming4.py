@@ -1,65 +1,91 @@
+import startup   # first: marks where the interpreter hands over
 import os
-import shutil
-import subprocess
+import sys
 from datetime import datetime
 from tkinter import (Tk, Toplevel, Label, Entry, Button, StringVar,
-                     messagebox, Listbox, ttk)
-import threading
+                     messagebox, ttk)
 import tkinter
 import configparser
+import timing
+from engine import Engine
+from source_index import SourceWatcher
+from sidebar import SidebarModel, VirtualList
+from copy_engine import CopyCancelled, format_rate
+from local_cache import cache_dir
+from ui_dispatch import Dispatcher, STALL_MS
+from preview import Debouncer, RenderStats, PageCache, DiskPageCache, PdfView, Prefetcher, PREVIEW_DEBOUNCE_MS
+startup.mark("imports")
 
 # --- Load configuration ---
 config = configparser.ConfigParser()
 config.read('config.ini')
-
-# Read UNC paths from config
-i_ori_dir   = config.get('network', 'ori_dir')
-i_dst_dir   = config.get('network', 'dst_dir')
-merge_dir = config.get('network', 'merge_dir')
-
-# credentials
-username = config.get('credentials', 'username')
-pwd_a     = config.get('credentials', 'pwd_a')
-pwd_b     = config.get('credentials', 'pwd_b')
-
-def map_network_drive_cmd(local_drive, remote_path, username, password):
-    cmd = ["net", "use", local_drive, remote_path]
-    if username and password:
-        cmd.extend([password, "/user:" + username])
-    try:
-        subprocess.run(cmd, check=True)
-        print(f"Drive {local_drive} mapped to {remote_path}")
-    except subprocess.CalledProcessError as e:
-        print("Error mapping drive:", e)
-
-map_network_drive_cmd("A:", i_ori_dir, username, pwd_a)
-map_network_drive_cmd("B:", i_dst_dir, username, pwd_b)
-
-# gather files in source directory
-files = [os.path.join(i_ori_dir, f) for f in os.listdir(i_ori_dir)
-         if os.path.isfile(os.path.join(i_ori_dir, f))]
-if not files:
+# phase timings to the local log; [diagnostics] / PPC_PROFILE for profiling
+timing.configure(config)
+
+# shares, credentials and copy tuning ([network], [credentials], [copy])
+engine = Engine.from_config(config)
+i_ori_dir = engine.ori_dir
+i_dst_dir, merge_dir = engine.dst_dirs
+
+# default for "also copy to merge_dir" (one read of the source, both servers)
+fan_out = config.getboolean('copy', 'fan_out', fallback=False)
+
+# preview: rendered pages are cached in memory up to cache_mb and on local
+# disk up to disk_cache_mb, so revisited drawings don't touch the share
+preview_zoom = config.getfloat('preview', 'zoom', fallback=1.0)
+page_cache = PageCache(
+    config.getint('preview', 'cache_mb', fallback=256) * 1024 * 1024,
+    DiskPageCache(cache_dir('previews'),
+                  config.getint('preview', 'disk_cache_mb', fallback=1024) * 1024 * 1024))
+# sidebar neighbours (either side of the selection) whose first page is
+# rendered in the background
+prefetch_neighbours = config.getint('preview', 'prefetch_neighbours', fallback=3)
+prefetch_workers = config.getint('preview', 'prefetch_workers', fallback=2)
+
+# watch mode: keep the sidebar live while scans arrive and reopen the dialog
+# after each confirm; a new file shows up within poll_interval seconds
+watch = config.getboolean('source', 'watch', fallback=False) or '--watch' in sys.argv
+poll_interval = config.getfloat('source', 'poll_interval', fallback=0.5)
+startup.mark("config")
+
+# map A:/B: in the background (drives already mapped are left alone) so the
+# window comes up while `net use` runs, and start reading the content index
+# (digests of filed drawings, for the duplicate check on confirm); anything
+# touching the shares waits for the mapping first
+engine.preload()
+startup.mark("drive mapping")
+
+# gather files in source directory: open from the local snapshot when there is
+# one (revalidated in the background once the window is up), else scan the share
+index = engine.scan_source()
+index_stale = engine.source_stale
+# sidebar rows, newest first; also supplies (size, mtime) to the preview cache
+model = SidebarModel(index.entries)
+if not len(model):
     messagebox.showerror("No Files Found", "No files in source directory.")
     exit(1)
+startup.mark("listing")
 
 # --- Tkinter setup ---
 root = Tk()
 root.withdraw()
 
-# thread-safe PhotoImage patch
-from tkinter import PhotoImage as OriginalPhotoImage
+# worker threads never touch Tk: they post to this queue, which the Tk loop
+# drains in batches; it also reports stalls of the Tk thread
+ui = Dispatcher(root, stall_ms=config.getint('diagnostics', 'stall_ms', fallback=STALL_MS)).start()
+
+# open sidebars; source diffs from revalidation / the watcher patch the shared
+# model once and then redraw each of these
+sidebar_views = []
 
-def safe_PhotoImage(*args, **kwargs):
-    if threading.current_thread() is not threading.main_thread():
-        event = threading.Event(); result = {}
-        def create():
-            result['img'] = OriginalPhotoImage(*args, **kwargs)
-            event.set()
-        root.after(0, create); event.wait()
-        return result['img']
-    return OriginalPhotoImage(*args, **kwargs)
+def apply_source_diff(added, removed, changed):
+    model.apply_diff(added, removed, changed)
+    for view in sidebar_views:
+        view.refresh()
 
-tkinter.PhotoImage = safe_PhotoImage
+def on_source_diff(*diff):
+    # runs on the revalidation / watcher thread
+    ui.post(apply_source_diff, *diff)
 
 # center-window helper
 def center_window(window, w, h):
@@ -77,6 +103,10 @@ def get_dwg_input():
     top.title("Enter MO Number, Preview & Confirm")
     center_window(top, 1200, 900)
 
+    # list dst_dir (and merge_dir) once while the user types; on_confirm only
+    # looks them up
+    engine.scan_destinations(refresh=True)
+
     # --- NEW: use a PanedWindow so the sidebar is resizable by dragging its sash ---
     paned = ttk.PanedWindow(top, orient='horizontal')
     paned.pack(fill='both', expand=True, padx=10, pady=10)
@@ -86,24 +116,30 @@ def get_dwg_input():
     paned.add(sidebar, weight=1)   # weight=1 makes sidebar take a proportional share
     paned.add(content, weight=4)   # weight=4 makes content larger by default
 
-    # --- NEW: sidebar file list with its own vertical scrollbar ---
-    sb_scroll = tkinter.Scrollbar(sidebar, orient='vertical')
-    lb = Listbox(sidebar, yscrollcommand=sb_scroll.set)
-    sb_scroll.config(command=lb.yview)
-    sb_scroll.pack(side='right', fill='y', padx=(0,5), pady=5)
-    lb.pack(side='left', fill='both', expand=True, padx=(5,0), pady=5)
-
-    for fpath in files:
-        lb.insert('end', os.path.basename(fpath))
-    lb.selection_set(0)
-
-    selected_file = {'path': files[0]}
-    def on_select(evt):
-        idx = evt.widget.curselection()
-        if not idx: return
-        selected_file['path'] = files[idx[0]]
-        build_preview()
-    lb.bind('<<ListboxSelect>>', on_select)
+    # --- sidebar: type-to-filter box over a virtualized, newest-first list ---
+    filter_var = StringVar(top)
+    model.set_filter('')   # a reopened dialog starts unfiltered
+    Entry(sidebar, textvariable=filter_var).pack(fill='x', padx=5, pady=(5,0))
+
+    selected_file = {'path': model.view[0].path}
+    def on_select(entry):
+        selected_file['path'] = entry.path
+        engine.stage(entry.path)   # preview and copy then read the local copy
+        prefetcher.cancel()   # neighbours of the old selection are stale now
+        update_labels()
+        schedule_render()
+
+    file_list = VirtualList(sidebar, model, on_select, bg='#f0f0f0')
+    file_list.pack(fill='both', expand=True)
+    file_list.selected = selected_file['path']
+    file_list.refresh()
+    sidebar_views.append(file_list)
+
+    def on_filter(*a):
+        model.set_filter(filter_var.get())
+        file_list.first = 0
+        file_list.refresh()
+    filter_var.trace_add('write', on_filter)
 
     # --- Content: inputs + preview ---
     main_frame = tkinter.Frame(content)
@@ -141,87 +177,230 @@ def get_dwg_input():
     Entry(input_frame, textvariable=seq_var, validate="key",
           validatecommand=vc, width=8).grid(row=1,column=4)
 
-    # Preview area
+    fan_out_var = tkinter.BooleanVar(top, value=fan_out)
+    tkinter.Checkbutton(input_frame, text=f"Also copy to {merge_dir}",
+                        variable=fan_out_var).grid(row=2,column=0,columnspan=5,pady=(5,0))
+
+    # next free sequence for the year + project typed so far (click to use
+    # it), and a warning when the number already has files in dst_dir
+    hint_label = Label(input_frame, fg='#555555', cursor='hand2')
+    hint_label.grid(row=3,column=0,columnspan=5,pady=(5,0))
+    hint = {'next': None}
+    hint_label.bind('<Button-1>', lambda e: hint['next'] and seq_var.set(hint['next']))
+
+    # Copy progress, shown under the preview while a copy runs
+    progress_frame = tkinter.Frame(main_frame)
+    progress_frame.pack(side='bottom', fill='x')
+    progress_var = tkinter.DoubleVar(top)
+    progress_bar = ttk.Progressbar(progress_frame, variable=progress_var, maximum=100)
+    progress_label = Label(progress_frame, text="")
+    copy_state = {'job': None, 'reserving': False, 'closing': False}
+
+    # Preview area: built once; typing only retexts the labels and the PDF
+    # is re-rendered only when the selected file changes
     preview_frame = tkinter.Frame(main_frame)
     preview_frame.pack(fill='both', expand=True)
 
-    def build_preview():
-        # clear
-        for w in preview_frame.winfo_children(): w.destroy()
-
-        # MO Number label
+    mo_label = Label(preview_frame)
+    mo_label.pack(pady=5)
+    name_label = Label(preview_frame, font=("TkDefaultFont",10))
+    name_label.pack(pady=5)
+    stats = RenderStats()
+    # the preview waits for a pull of the selected file already under way
+    # rather than read it off the share a second time
+    pdf_view = PdfView(preview_frame, page_cache, zoom=preview_zoom, stats=stats,
+                       local=lambda p: engine.local(p, wait=True), ui=ui)
+    pdf_view.pack(fill='both', expand=True, pady=5)
+    prefetcher = Prefetcher(page_cache, zoom=preview_zoom,
+                            workers=prefetch_workers, stats=stats, local=engine.local)
+
+    btns = tkinter.Frame(preview_frame)
+    btns.pack(pady=10)
+    Button(btns, text="Confirm", command=lambda: on_confirm()).grid(row=0,column=0,padx=5)
+    Button(btns, text="Cancel",  command=lambda: on_cancel()).grid(row=0,column=1,padx=5)
+
+    shown = {'path': None}
+
+    def update_labels():
         y = year_var.get() or opts[2]
         p = project_var.get().zfill(4)
         s = seq_var.get().zfill(4)
-        Label(preview_frame,
-              text=f"MO Number: {y} - {p} - {s}",
-              font=("TkDefaultFont",12,"bold"))
-        Label(preview_frame,
-              text=f"MO Number: {y} - {p} - {s}").pack(pady=5)
-
-        # Filename preview
         ext = os.path.splitext(selected_file['path'])[1]
-        newname = f"D{y}{p}{s}{ext}"
-        Label(preview_frame,
-              text=f"New File Name: {newname}",
-              font=("TkDefaultFont",10)).pack(pady=5)
-
-        # PDF Viewer
-        try:
-            from tkPDFViewer import tkPDFViewer as pdf
-        except ImportError:
-            messagebox.showerror("Missing Module",
-                                 "tkPDFViewer is required.")
-            top.destroy(); return
-
-        holder = tkinter.Frame(preview_frame)
-        holder.pack(fill='both', expand=True, pady=5)
-        viewer = pdf.ShowPdf()
-        pdf_widget = viewer.pdf_view(
-            holder,
-            pdf_location=selected_file['path'],
-            width=120, height=40
-        )
-        pdf_widget.pack(fill='both', expand=True)
-
-        # buttons
-        btns = tkinter.Frame(preview_frame)
-        btns.pack(pady=10)
-        Button(btns, text="Confirm", command=on_confirm).grid(row=0,column=0,padx=5)
-        Button(btns, text="Cancel",  command=on_cancel).grid(row=0,column=1,padx=5)
+        mo_label.config(text=f"MO Number: {y} - {p} - {s}")
+        name_label.config(text=f"New File Name: D{y}{p}{s}{ext}")
+        update_hint(y, project_var.get(), seq_var.get())
+        stats.label_updates += 1
+
+    def update_hint(y, p, s):
+        # indexed lookups in the local drawing index: no share access per key
+        if not p:
+            hint['next'] = None
+            hint_label.config(text=""); return
+        hint['next'] = engine.next_sequence(y, p)
+        text = (f"Next free sequence for {y}-{p.zfill(4)}: {hint['next']}" if hint['next']
+                else f"No free sequence left for {y}-{p.zfill(4)}")
+        filed = engine.existing_revisions(y, p, s) if s else []
+        if filed:
+            more = f" and {len(filed) - 3} more" if len(filed) > 3 else ""
+            text += f"\nAlready filed: {', '.join(filed[-3:])}{more}"
+        hint_label.config(text=text, fg='#b00000' if filed else '#555555')
+
+    def render_pdf():
+        if shown['path'] == selected_file['path']:
+            stats.skipped += 1; return
+        pdf_view.load(selected_file['path'], model.stat(selected_file['path']))
+        shown['path'] = selected_file['path']
+        prefetch_neighbours_of(selected_file['path'])
+
+    def prefetch_neighbours_of(path):
+        # next, previous, next+1, previous+1, ... nearest first
+        i = file_list.position(path)
+        if i is None: return
+        rows = model.view
+        order = []
+        for d in range(1, prefetch_neighbours + 1):
+            order += [j for j in (i + d, i - d) if 0 <= j < len(rows)]
+        prefetcher.schedule([(rows[j].path, (rows[j].size, rows[j].mtime)) for j in order])
+
+    # arrowing through the sidebar renders only where the user stops
+    schedule_render = Debouncer(top, PREVIEW_DEBOUNCE_MS, render_pdf)
 
     def on_confirm():
+        if copy_state['job'] or copy_state['reserving']: return
         y = year_var.get() or opts[2]
         p = project_var.get().zfill(4)
         s = seq_var.get().zfill(4)
-        ext = os.path.splitext(selected_file['path'])[1]
-        fn  = f"D{y}{p}{s}{ext}"
-        dest = os.path.join(i_dst_dir, fn)
-        i = 1
-        while os.path.exists(dest):
-            fn   = f"D{y}{p}{s}-R{i:03}{ext}"
-            dest = os.path.join(i_dst_dir, fn)
-            i  += 1
-        shutil.copy2(selected_file['path'], dest)
-        messagebox.showinfo("File Renamed", f"Copied:{dest}")
-        top.confirmed = True; top.destroy()
+        src = selected_file['path']
+        ext = os.path.splitext(src)[1]
+        targets = [i_dst_dir, merge_dir] if fan_out_var.get() else [i_dst_dir]
+        # the duplicate check and reservations touch the shares: run them on
+        # a worker and pick the result up on the Tk loop
+        copy_state['reserving'] = True
+        ui.in_background(reserve_targets, src, f"D{y}{p}{s}", ext, targets,
+                         then=lambda f: start_copy(src, f))
+
+    def reserve_targets(src, dwg_number, ext, targets):
+        # each server gets its own -R### reservation; one that can't be
+        # reached fails on its own instead of blocking the others. A server
+        # that already holds these exact bytes under this number is skipped.
+        dests, failed, existing = [], {}, {}
+        for d in targets:
+            try:
+                dup = engine.find_existing(src, dwg_number, ext, d)
+                if dup:
+                    existing[d] = dup; continue
+                dests.append(engine.reserve(dwg_number, ext, d))
+            except OSError as e:
+                failed[d] = e
+        return dests, failed, existing
+
+    def start_copy(src, reserved):
+        copy_state['reserving'] = False
+        dests = [] if reserved.exception() else reserved.result()[0]
+        if copy_state['closing']:
+            # cancelled while reserving: give the names back, then close
+            for d in dests: ui.in_background(engine.release, d)
+            top.destroy(); return
+        if reserved.exception() is not None:
+            messagebox.showerror("Copy Failed", f"Could not reserve a name:\n\n{reserved.exception()}")
+            return
+        dests, failed, existing = reserved.result()
+        if not dests:
+            copy_finished(failed, existing); return
+
+        progress_var.set(0); progress_label.config(text="Copying...")
+        progress_bar.pack(fill='x', padx=5, pady=(5,0))
+        progress_label.pack(pady=(0,5))
+        # worker-thread callbacks are posted to the Tk loop
+        on_progress = ui.wrap(show_progress)
+        on_done = lambda res: ui.post(copy_finished, {**failed, **res}, existing)
+        copy_state['job'] = engine.copy_job(src, dests, on_progress, on_done)
+
+    def show_progress(done, total, rate):
+        if not top.winfo_exists(): return
+        pct = 100.0 * done / total if total else 100.0
+        progress_var.set(pct)
+        progress_label.config(text=f"{pct:.0f}%  ({format_rate(rate)})")
+
+    def copy_finished(results, existing={}):
+        # results: {destination path (or dir if never reserved): error or None}
+        # existing: {server dir: file already holding the same bytes}
+        copy_state['job'] = None
+        for dest, err in results.items():
+            # keys that are still a server dir never got a reservation
+            if err is not None and dest not in (i_dst_dir, merge_dir): ui.in_background(engine.release, dest)
+        copied = [d for d, err in results.items() if err is None]
+        errors = [(d, err) for d, err in results.items()
+                  if err is not None and not isinstance(err, CopyCancelled)]
+        lines = ([f"Copied: {d}" for d in copied] + [f"Already filed: {d}" for d in existing.values()]
+                 + [f"FAILED: {d}\n    {err}" for d, err in errors])
+        if copied or existing:
+            show = messagebox.showwarning if errors else messagebox.showinfo
+            show("File Renamed", "\n".join(lines))
+            top.confirmed = True; top.destroy()
+            return
+        progress_bar.pack_forget(); progress_label.pack_forget()
+        if errors:
+            messagebox.showerror("Copy Failed", "\n".join(lines))
 
     def on_cancel():
+        # first Cancel stops a running copy; otherwise close the dialog
+        if copy_state['job']:
+            copy_state['job'].cancel(); return
+        if copy_state['reserving']:
+            # close once the reservations are back, so they can be released
+            copy_state['closing'] = True; return
         top.destroy()
+    top.protocol("WM_DELETE_WINDOW", on_cancel)
 
     # initial render
-    build_preview()
-    project_var.trace_add('write', lambda *a: build_preview())
-    seq_var.trace_add('write',     lambda *a: build_preview())
+    update_labels()
+    render_pdf()
+    for var in (year_var, project_var, seq_var):
+        var.trace_add('write', lambda *a: update_labels())
+
+    if startup.marks[-1][0] != "first paint":
+        top.update_idletasks()
+        startup.mark("first paint")
+        timing.record("startup", startup.marks[-1][1] - startup.START, phases=startup.phases())
+        if startup.report():
+            os._exit(0)   # startup benchmark run: stop once the window is up
 
     top.grab_set()
     top.wait_window()
+    sidebar_views.remove(file_list)
+    prefetcher.shutdown()
+    print(stats.report(page_cache))
+    if engine.staging is not None:
+        print(engine.staging.report())
     return getattr(top, 'confirmed', False)
 
 # --- Main flow ---
 def main_flow():
-    if not get_dwg_input():
+    # a snapshot is revalidated once either way (the watcher does it before
+    # following changes); both start once the drives are mapped
+    sync = {}
+    def start_sync(_):
+        engine.stage(model.view[0].path)   # latest file: the likely pick
+        if watch:
+            sync['watcher'] = SourceWatcher(index, on_source_diff, poll_interval,
+                                            revalidate=index_stale).start()
+        elif index_stale:
+            index.revalidate_async(on_source_diff)
+    engine.connect().add_done_callback(start_sync)
+    confirmed = get_dwg_input()
+    while watch and confirmed:
+        confirmed = get_dwg_input()
+    if watch:
+        if 'watcher' in sync: sync['watcher'].stop()
+        try:
+            index.save_snapshot()
+        except OSError as e:
+            print("Could not save source snapshot:", e)
+    elif not confirmed:
         messagebox.showerror("Cancelled", "Operation cancelled.")
+    ui.stop()
+    engine.close()
     root.destroy()
 
 root.after(0, main_flow)
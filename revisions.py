@@ -0,0 +1,139 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# <drawing number>[-R###]<ext>, e.g. D2250148 0007-R002.pdf
+NAME_RE = re.compile(r"^(?P<dwg>.*?)(?:-R(?P<rev>\d+))?(?P<ext>\.[^.]*)?$", re.IGNORECASE)
+
+
+def parse_name(name):
+    """Split a destination file name into (drawing number, revision, ext).
+
+    revision is 0 for the bare name and N for -R00N.
+    """
+    m = NAME_RE.match(name)
+    rev = int(m.group("rev")) if m.group("rev") else 0
+    return m.group("dwg"), rev, m.group("ext") or ""
+
+
+def year_code(year):
+    """The dialog's year field: 2025 -> "225" (first digit + last two)."""
+    y = str(year).strip()
+    if len(y) == 4 and y.isdigit():
+        return y[0] + y[2:]
+    if len(y) == 3 and y.isdigit():
+        return y
+    raise ValueError(f"Bad year: {year!r}")
+
+
+def drawing_number(year, project, seq):
+    """D{year}{project:04}{seq:04}, the drawing number the dialog builds."""
+    parts = []
+    for label, v in (("project", project), ("sequence", seq)):
+        v = str(v).strip()
+        if not (v.isdigit() and len(v) <= 4):
+            raise ValueError(f"Bad {label}: {v!r}")
+        parts.append(v.zfill(4))
+    return f"D{year_code(year)}{parts[0]}{parts[1]}"
+
+
+def revision_name(dwg_number, rev, ext):
+    if rev == 0:
+        return f"{dwg_number}{ext}"
+    return f"{dwg_number}-R{rev:03}{ext}"
+
+
+class RevisionIndex:
+    """Highest revision per (drawing number, extension) in dst_dir.
+
+    Built from a single directory listing; Windows shares are case-insensitive,
+    so keys are normalised the same way.
+    """
+
+    def __init__(self, dst_dir, names=()):
+        self.dst_dir = dst_dir
+        self.revs = {}
+        self.names = {}   # same keys -> every name seen for that drawing
+        for n in names:
+            self.record(n)
+
+    @classmethod
+    def scan(cls, dst_dir):
+        with os.scandir(dst_dir) as it:
+            return cls(dst_dir, [e.name for e in it])
+
+    @staticmethod
+    def _key(dwg_number, ext):
+        return dwg_number.upper(), ext.lower()
+
+    def record(self, name):
+        dwg, rev, ext = parse_name(name)
+        key = self._key(dwg, ext)
+        self.revs[key] = max(self.revs.get(key, -1), rev)
+        self.names.setdefault(key, set()).add(name)
+
+    def latest(self, dwg_number, ext):
+        # -1 when nothing exists yet for this drawing number
+        return self.revs.get(self._key(dwg_number, ext), -1)
+
+    def paths(self, dwg_number, ext):
+        # existing files for this drawing number, bare name and -R### alike
+        names = self.names.get(self._key(dwg_number, ext), ())
+        return [os.path.join(self.dst_dir, n) for n in sorted(names)]
+
+    def next_name(self, dwg_number, ext):
+        """Next free name: the bare number first, then one past the highest -R###.
+
+        Unlike the old probe loop this never reuses a gap left by a deleted
+        revision, so a revision number always means the same file.
+        """
+        return revision_name(dwg_number, self.latest(dwg_number, ext) + 1, ext)
+
+    def next_path(self, dwg_number, ext):
+        return os.path.join(self.dst_dir, self.next_name(dwg_number, ext))
+
+
+def reserve(index, dwg_number, ext, attempts=1000):
+    """Atomically claim the next free name in index.dst_dir and return its path.
+
+    The name is created empty with O_EXCL, so of several workstations racing
+    for the same -R### exactly one wins; the others record the loss and move
+    on to the following revision. The caller copies into the reserved file
+    and must release() it if the copy fails.
+    """
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0)
+    for _ in range(attempts):
+        path = index.next_path(dwg_number, ext)
+        try:
+            fd = os.open(path, flags)
+        except FileExistsError:
+            # taken since our listing (or by another workstation just now)
+            index.record(os.path.basename(path))
+            continue
+        os.close(fd)
+        index.record(os.path.basename(path))
+        return path
+    raise FileExistsError(f"No free revision for {dwg_number}{ext} after {attempts} attempts")
+
+
+def release(path):
+    # drop a reservation whose copy never completed
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def scan_in_background(dst_dir, wait=None):
+    """Start listing dst_dir on a worker thread; returns a Future of RevisionIndex.
+
+    wait(), if given, runs first on the same thread (e.g. drive mapping).
+    """
+    def scan():
+        if wait:
+            wait()
+        return RevisionIndex.scan(dst_dir)
+    ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="revision-scan")
+    fut = ex.submit(scan)
+    ex.shutdown(wait=False)
+    return fut
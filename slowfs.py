@@ -0,0 +1,216 @@
+"""A local directory that behaves like an SMB share, for benchmarks.
+
+SlowShares(shares) patches the os, os.path and open calls the tools make so
+that, for paths under a share's root, every metadata call (stat, listing,
+open, rename, delete) waits one round trip and file data moves no faster
+than the share's bandwidth. The bandwidth is one link per share, shared by
+all threads, so parallel copies split it rather than multiply it. Paths
+outside every root (the local cache, temp files) are untouched.
+
+Only meant for bench.py: the patching is process-wide while active.
+"""
+import builtins
+import os
+import threading
+import time
+
+LIST_BATCH = 100   # directory entries returned per listing round trip
+
+
+class Share:
+    """One simulated share: `latency` seconds per round trip, `bandwidth` bytes/s (0 = unlimited)."""
+
+    def __init__(self, root, latency=0.0, bandwidth=0):
+        self.root = os.path.normcase(os.path.abspath(root))
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.calls = 0          # round trips charged
+        self.bytes = 0          # data moved over the link
+        self.lock = threading.Lock()
+        self.link_free = 0.0    # perf_counter time the link is next idle
+
+    def owns(self, path):
+        if isinstance(path, int):
+            return False
+        try:
+            p = os.path.normcase(os.path.abspath(os.fsdecode(path)))
+        except (TypeError, ValueError):
+            return False
+        return p == self.root or p.startswith(self.root + os.sep)
+
+    def round_trip(self, n=1):
+        with self.lock:
+            self.calls += n
+        if self.latency:
+            time.sleep(self.latency * n)
+
+    def transfer(self, n):
+        # queue n bytes on the link behind whatever is already in flight
+        if n <= 0:
+            return
+        with self.lock:
+            self.bytes += n
+            if not self.bandwidth:
+                return
+            now = time.perf_counter()
+            start = max(now, self.link_free)
+            self.link_free = start + n / self.bandwidth
+            wait = self.link_free - now
+        time.sleep(wait)
+
+    def counters(self):
+        return {"calls": self.calls, "bytes": self.bytes}
+
+
+class SlowFile:
+    """A file object on a Share: each read/write is a round trip plus link time."""
+
+    def __init__(self, f, share, shim):
+        self._f = f
+        self._share = share
+        self._shim = shim
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._f)
+
+    def fileno(self):
+        # kernel-side copies (sendfile/copy_file_range) are charged by fd
+        fd = self._f.fileno()
+        self._shim.fds[fd] = self._share
+        return fd
+
+    def close(self):
+        try:
+            self._shim.fds.pop(self._f.fileno(), None)
+        except (OSError, ValueError):
+            pass
+        self._f.close()
+
+    def read(self, *a):
+        self._share.round_trip()
+        data = self._f.read(*a)
+        self._share.transfer(len(data))
+        return data
+
+    def readinto(self, b):
+        self._share.round_trip()
+        n = self._f.readinto(b)
+        self._share.transfer(n or 0)
+        return n
+
+    def write(self, data):
+        self._share.round_trip()
+        self._share.transfer(len(data))
+        return self._f.write(data)
+
+
+class SlowShares:
+    """Context manager that makes each of `shares` (Share objects) behave like a remote share."""
+
+    def __init__(self, shares):
+        self.shares = list(shares)
+        self.fds = {}          # fd -> Share, for kernel-side copies
+        self.saved = {}
+
+    def share_for(self, path):
+        for s in self.shares:
+            if s.owns(path):
+                return s
+        return None
+
+    def _charged(self, fn):
+        def call(path, *a, **kw):
+            share = self.share_for(path)
+            if share is not None:
+                share.round_trip()
+            return fn(path, *a, **kw)
+        return call
+
+    def _patch(self, owner, name, fn):
+        self.saved[(owner, name)] = getattr(owner, name)
+        setattr(owner, name, fn)
+
+    def __enter__(self):
+        real_open, real_scandir, real_listdir = builtins.open, os.scandir, os.listdir
+
+        def slow_open(file, mode="r", *a, **kw):
+            share = self.share_for(file)
+            f = real_open(file, mode, *a, **kw)
+            if share is None:
+                return f
+            share.round_trip()
+            return SlowFile(f, share, self)
+
+        def slow_scandir(path="."):
+            share = self.share_for(path)
+            if share is None:
+                return real_scandir(path)
+            entries = list(real_scandir(path))
+            share.round_trip(1 + len(entries) // LIST_BATCH)
+            return _Listing(entries)
+
+        def slow_listdir(path="."):
+            names = real_listdir(path)
+            share = self.share_for(path)
+            if share is not None:
+                share.round_trip(1 + len(names) // LIST_BATCH)
+            return names
+
+        def kernel_copy(real, src_arg, dst_arg):
+            def call(*a, **kw):
+                n = real(*a, **kw)
+                for fd in (a[src_arg], a[dst_arg]):
+                    share = self.fds.get(fd)
+                    if share is not None:
+                        share.round_trip()
+                        share.transfer(n)
+                return n
+            return call
+
+        self._patch(builtins, "open", slow_open)
+        self._patch(os, "scandir", slow_scandir)
+        self._patch(os, "listdir", slow_listdir)
+        for name in ("stat", "lstat", "open", "replace", "rename", "remove", "unlink", "utime",
+                     "chmod", "mkdir"):
+            self._patch(os, name, self._charged(getattr(os, name)))
+        if hasattr(os, "sendfile"):
+            self._patch(os, "sendfile", kernel_copy(os.sendfile, 1, 0))
+        if hasattr(os, "copy_file_range"):
+            self._patch(os, "copy_file_range", kernel_copy(os.copy_file_range, 0, 1))
+        return self
+
+    def __exit__(self, *exc):
+        for (owner, name), fn in self.saved.items():
+            setattr(owner, name, fn)
+        self.saved = {}
+        self.fds = {}
+
+    def counters(self):
+        return {s.root: s.counters() for s in self.shares}
+
+
+class _Listing:
+    # what os.scandir returns, over entries already read
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def close(self):
+        pass
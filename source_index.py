@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+from local_cache import cache_file
+
+# One row of the source listing. size/mtime come from the DirEntry stat cache,
+# so building the index never issues a second round trip per file.
+FileEntry = namedtuple("FileEntry", ["path", "name", "size", "mtime"])
+
+
+def scan_dir(path):
+    """Walk `path` once with os.scandir and return a FileEntry per regular file."""
+    entries = []
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                if not e.is_file():
+                    continue
+                st = e.stat()
+            except OSError:
+                # entry vanished or is unreadable between readdir and stat
+                continue
+            entries.append(FileEntry(e.path, e.name, st.st_size, st.st_mtime))
+    return entries
+
+
+def diff_entries(old, new):
+    """Return (added, removed, changed) between two entry lists, matched by name."""
+    before = {e.name: e for e in old}
+    after = {e.name: e for e in new}
+    added = [e for n, e in after.items() if n not in before]
+    removed = [e for n, e in before.items() if n not in after]
+    changed = [e for n, e in after.items()
+               if n in before and (before[n].size, before[n].mtime) != (e.size, e.mtime)]
+    return added, removed, changed
+
+
+def snapshot_path(root):
+    return cache_file("snapshots", root, ".json")
+
+
+class SourceIndex:
+    def __init__(self, root, entries):
+        self.root = root
+        self.entries = list(entries)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def scan(cls, root):
+        return cls(root, scan_dir(root))
+
+    # --- Snapshot persistence ---
+    @classmethod
+    def load_snapshot(cls, root, path=None):
+        # None when there is no usable snapshot for this root
+        path = path or snapshot_path(root)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("root") != root:
+            return None
+        entries = [FileEntry(os.path.join(root, n), n, size, mtime)
+                   for n, size, mtime in data.get("entries", [])]
+        return cls(root, entries)
+
+    def save_snapshot(self, path=None):
+        path = path or snapshot_path(self.root)
+        with self.lock:
+            rows = [[e.name, e.size, e.mtime] for e in self.entries]
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"root": self.root, "entries": rows}, f)
+        os.replace(tmp, path)
+
+    # --- Stale-while-revalidate ---
+    def revalidate(self, path=None):
+        """Rescan the share, swap in the fresh entries and return the diff."""
+        fresh = scan_dir(self.root)
+        with self.lock:
+            diff = diff_entries(self.entries, fresh)
+            self.entries = fresh
+        try:
+            self.save_snapshot(path)
+        except OSError as e:
+            print("Could not save source snapshot:", e)
+        return diff
+
+    def revalidate_async(self, on_diff, path=None):
+        # on_diff(added, removed, changed) runs on the worker thread
+        def worker():
+            try:
+                diff = self.revalidate(path)
+            except OSError as e:
+                print("Source revalidation failed:", e)
+                return
+            if any(diff):
+                on_diff(*diff)
+        t = threading.Thread(target=worker, name="source-revalidate", daemon=True)
+        t.start()
+        return t
+
+    def apply_diff(self, added, removed, changed):
+        with self.lock:
+            gone = {e.name for e in removed} | {e.name for e in added + changed}
+            self.entries = [e for e in self.entries if e.name not in gone] + added + changed
+
+    # --- Lookups ---
+    def __len__(self):
+        return len(self.entries)
+
+    def latest(self):
+        # newest file by mtime; None when the directory holds no files
+        if not self.entries:
+            return None
+        return max(self.entries, key=lambda e: e.mtime)
+
+    def paths(self):
+        return [e.path for e in self.entries]
+
+
+def open_index(root, wait=None):
+    """Return (index, stale): the cached snapshot if one exists, else a fresh scan.
+
+    wait(), if given, is called before the share is touched (e.g. until the
+    drive mapping is done); a snapshot hit never calls it.
+    """
+    index = SourceIndex.load_snapshot(root)
+    if index is not None and len(index):
+        return index, True
+    if wait:
+        wait()
+    index = SourceIndex.scan(root)
+    try:
+        index.save_snapshot()
+    except OSError as e:
+        print("Could not save source snapshot:", e)
+    return index, False
+
+
+def entry_for(path):
+    # FileEntry for one path, or None if it is gone / not a regular file
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return FileEntry(path, os.path.basename(path), st.st_size, st.st_mtime)
+
+
+class SourceWatcher:
+    """Keeps a SourceIndex live and reports (added, removed, changed) diffs.
+
+    Uses watchdog filesystem notifications when the package is installed
+    and the observer starts on this path; otherwise polls. A poll costs one
+    stat of the directory while nothing arrives. When the directory mtime
+    moves it re-reads the listing and compares names, sizes and mtimes. New
+    and changed files are re-stat'ed on the following polls until their size
+    stops changing, so a scan still being written is reported again as
+    `changed` as it grows. on_diff runs on the watcher thread.
+
+    With revalidate (for an index opened from the snapshot), the share is
+    rescanned once at start, since neither mode reports what changed while
+    the tool was closed.
+    """
+
+    def __init__(self, index, on_diff, interval=0.5, revalidate=True):
+        self.index = index
+        self.on_diff = on_diff
+        self.interval = interval
+        self.revalidate = revalidate
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.thread = None
+
+    def start(self):
+        polling = not self._start_observer()
+        self.thread = threading.Thread(target=self._run, args=(polling,), name="source-watch",
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+
+    def _run(self, polling):
+        if self.revalidate:
+            try:
+                diff = self.index.revalidate()
+            except OSError as e:
+                print("Source revalidation failed:", e)
+            else:
+                if any(diff):
+                    self.on_diff(*diff)
+        if polling:
+            self._poll()
+
+    def _emit(self, added, removed, changed):
+        if added or removed or changed:
+            self.index.apply_diff(added, removed, changed)
+            self.on_diff(added, removed, changed)
+
+    # --- notifications ---
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                watcher._notified(event, event.src_path, None)
+
+            def on_modified(self, event):
+                watcher._notified(event, event.src_path, None)
+
+            def on_deleted(self, event):
+                watcher._notified(event, None, event.src_path)
+
+            def on_moved(self, event):
+                watcher._notified(event, event.dest_path, event.src_path)
+
+        try:
+            observer = Observer()
+            observer.schedule(Handler(), self.index.root, recursive=False)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            print("File notifications unavailable, polling instead:", e)
+            return False
+        self.observer = observer
+        return True
+
+    def _notified(self, event, new_path, old_path):
+        if event.is_directory:
+            return
+        with self.index.lock:
+            known = {e.name: e for e in self.index.entries}
+        added, removed, changed = [], [], []
+        if old_path is not None and os.path.basename(old_path) in known:
+            removed.append(known[os.path.basename(old_path)])
+        if new_path is not None:
+            e = entry_for(new_path)
+            old = known.get(os.path.basename(new_path))
+            if e is not None and old is None:
+                added.append(e)
+            elif e is not None and (old.size, old.mtime) != (e.size, e.mtime):
+                changed.append(e)
+        self._emit(added, removed, changed)
+
+    # --- polling fallback ---
+    def _poll(self):
+        root = self.index.root
+        last_mtime = None
+        settling = {}   # name -> (size, mtime) at the previous poll
+        while not self.stop_event.wait(self.interval):
+            try:
+                dir_mtime = os.stat(root).st_mtime
+                changed = self._settle(settling)
+                added, removed = [], []
+                if dir_mtime != last_mtime:
+                    added, removed, relisted = self._relist(settling)
+                    seen = {e.name for e in changed}
+                    changed += [e for e in relisted if e.name not in seen]
+                    last_mtime = dir_mtime
+            except OSError as e:
+                print("Source watch poll failed:", e)
+                continue
+            self._emit(added, removed, changed)
+
+    def _relist(self, settling):
+        with self.index.lock:
+            known = {e.name: e for e in self.index.entries}
+        names = set()
+        added, changed = [], []
+        with os.scandir(self.index.root) as it:
+            for d in it:
+                try:
+                    if not d.is_file():
+                        continue
+                    st = d.stat()
+                except OSError:
+                    continue
+                names.add(d.name)
+                old = known.get(d.name)
+                if old is not None and (old.size, old.mtime) == (st.st_size, st.st_mtime):
+                    continue
+                e = FileEntry(d.path, d.name, st.st_size, st.st_mtime)
+                (added if old is None else changed).append(e)
+                settling[d.name] = (st.st_size, st.st_mtime)
+        removed = [e for n, e in known.items() if n not in names]
+        return added, removed, changed
+
+    def _settle(self, settling):
+        changed = []
+        for name, seen in list(settling.items()):
+            e = entry_for(os.path.join(self.index.root, name))
+            if e is None or (e.size, e.mtime) == seen:
+                del settling[name]
+            else:
+                settling[name] = (e.size, e.mtime)
+                changed.append(e)
+        return changed
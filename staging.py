@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from copy_engine import DEFAULT_CHUNK, CopyCancelled, copy_file
+from local_cache import evict_lru
+import timing
+
+STAGE_MAX_BYTES = 1024 * 1024 * 1024   # files larger than the whole cache are never staged
+
+
+class StagingCache:
+    """Local copies of source files, pulled off the share ahead of use.
+
+    stage() queues a pull on a single worker thread, cancelling pulls of
+    files no longer asked for, even mid-copy; the preview and the copy then
+    read local(path) instead of the share. A staged file is named after
+    (path, size, mtime) of the source when it was pulled, so local() only
+    hands it out while a stat of the share still matches: an edited source
+    falls back to the share until it is staged again. Staged files keep the
+    source's mtime (a copy made from one must carry it on), so use is tracked
+    in atime, bumped on every hit; the oldest-used go first past max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=STAGE_MAX_BYTES, chunk_size=DEFAULT_CHUNK):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+        self.pulled = 0        # bytes copied off the share
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="staging")
+        self.pending = {}      # source path -> Future, queued or running
+        self.cancels = {}      # source path -> Event stopping its pull
+        os.makedirs(root, exist_ok=True)
+        self.size = 0
+        with os.scandir(root) as it:
+            for e in it:
+                if not e.is_file():
+                    continue
+                if e.name.endswith(".part"):
+                    os.remove(e.path)   # pull cut short by the last session
+                else:
+                    self.size += e.stat().st_size
+
+    def _file(self, path, size, mtime):
+        key = repr((path, size, mtime)).encode("utf-8")
+        return os.path.join(self.root, hashlib.sha1(key).hexdigest() + os.path.splitext(path)[1])
+
+    def stage(self, paths):
+        """Start pulling `paths` (in priority order) onto local disk.
+
+        Pulls of other files are dropped, or cancelled if already running,
+        so following the selection never leaves the worker busy with files
+        already passed.
+        Nothing here touches the share; returns {path: Future of the staged
+        file, or None when it could not be staged}.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        with self.lock:
+            for path, fut in list(self.pending.items()):
+                if path in paths:
+                    continue
+                if fut.cancel():
+                    del self.pending[path]
+                    del self.cancels[path]
+                else:
+                    self.cancels[path].set()   # running: stops at the next chunk
+            for path in paths:
+                if path not in self.pending or self.cancels[path].is_set():
+                    self.cancels[path] = threading.Event()
+                    self.pending[path] = self.executor.submit(self._pull, path, self.cancels[path])
+            return {path: self.pending[path] for path in paths}
+
+    def pending_for(self, path):
+        """Future of a queued or running pull of path, or None."""
+        with self.lock:
+            return self.pending.get(path)
+
+    def _pull(self, path, cancel):
+        try:
+            st = os.stat(path)
+            fp = self._file(path, st.st_size, st.st_mtime)
+            if os.path.exists(fp):
+                return fp
+            if st.st_size > self.max_bytes:
+                return None
+            try:
+                with timing.span("stage_pull", src=path) as f:
+                    n = f["bytes"] = copy_file(path, fp, self.chunk_size, cancel=cancel)
+            except CopyCancelled:
+                return None
+            staged = os.stat(fp)
+            if (staged.st_size, staged.st_mtime) != (st.st_size, st.st_mtime):
+                # the source changed while it was read
+                os.remove(fp)
+                return None
+        finally:
+            with self.lock:
+                if self.cancels.get(path) is cancel:   # not re-staged since
+                    del self.pending[path], self.cancels[path]
+        with self.lock:
+            self.pulled += n
+            self.size += n
+            if self.size > self.max_bytes:
+                self.size = evict_lru(self.root, self.size, self.max_bytes, "st_atime", keep=fp)
+        return fp
+
+    def local(self, path, wait=False):
+        """The staged copy of path if it matches the share's size and mtime, else path.
+
+        wait=True first lets a running pull of path finish, for a reader that
+        would otherwise fetch the same bytes off the share; a pull still
+        queued behind another file is not waited for.
+        """
+        fut = self.pending_for(path) if wait else None
+        if fut is not None and fut.running():
+            try:
+                fut.result()
+            except Exception:
+                pass   # failed or dropped: read the share
+        try:
+            st = os.stat(path)
+        except OSError:
+            return path
+        fp = self._file(path, st.st_size, st.st_mtime)
+        try:
+            os.utime(fp, (time.time(), st.st_mtime))
+        except OSError:
+            self.misses += 1
+            return path
+        self.hits += 1
+        return fp
+
+    def shutdown(self):
+        with self.lock:
+            for fut in self.pending.values():
+                fut.cancel()
+            for cancel in self.cancels.values():
+                cancel.set()
+            self.pending = {}
+            self.cancels = {}
+        self.executor.shutdown(wait=False)
+
+    def report(self):
+        return (f"staging {self.hits} hits / {self.misses} misses, "
+                f"{self.pulled / (1024 * 1024):.0f} MB pulled")
@@ -0,0 +1,31 @@
+"""Wall-clock marks for the phases of a front-end's startup.
+
+Import this first: its import time is where the interpreter (and, frozen,
+the bootloader) hands over. With PPC_STARTUP_REPORT=<file> set, report()
+writes the marks there as JSON for `bench.py startup`.
+"""
+import json
+import os
+import time
+
+START = time.time()
+marks = [("interpreter", START)]
+
+
+def mark(phase):
+    marks.append((phase, time.time()))
+
+
+def phases():
+    # {phase: seconds since the previous mark}
+    return {p: round(t - marks[i][1], 6) for i, (p, t) in enumerate(marks[1:])}
+
+
+def report():
+    """Write the marks to $PPC_STARTUP_REPORT; True if a report was requested."""
+    path = os.environ.get("PPC_STARTUP_REPORT")
+    if not path:
+        return False
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"pid": os.getpid(), "marks": marks}, f)
+    return True
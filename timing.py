@@ -0,0 +1,182 @@
+"""Per-phase timing spans and optional whole-session profiling.
+
+span() and record() append one JSON line per phase to a rotating log in the
+local cache (logs/ppc.jsonl): the phase, its wall time, and whatever sizes
+go with it; a `bytes` field also gets bytes_per_sec. Drive mapping, share
+listings and copies against render times tell SMB slowness apart from
+rendering slowness. Nothing is written until configure() runs, so shared
+modules are timed unconditionally and bench.py stays quiet.
+
+PPC_PROFILE=cprofile|sample (or [diagnostics] profile) profiles the whole
+session: cProfile of the main (Tk) thread, or a sampler of every thread's
+stack. The result is written next to the log at exit.
+"""
+import atexit
+import configparser
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from local_cache import cache_dir
+
+LOG_NAME = "ppc.jsonl"
+LOG_BACKUPS = 5
+SAMPLE_INTERVAL = 0.005   # seconds between stack samples
+PROFILE_MODES = ("cprofile", "sample")
+
+SESSION = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+_log = logging.getLogger("ppc.timing")
+_log.propagate = False
+_state = {"script": None, "profiler": None}
+
+
+def configure(config=None, script=None):
+    """Start logging spans (unless [diagnostics] log = no) and profiling if asked for."""
+    _state["script"] = script or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    config = config or configparser.ConfigParser()
+    if config.getboolean('diagnostics', 'log', fallback=True) and not _log.handlers:
+        try:
+            handler = RotatingFileHandler(
+                os.path.join(cache_dir('logs'), LOG_NAME),
+                maxBytes=config.getint('diagnostics', 'log_mb', fallback=1) * 1024 * 1024,
+                backupCount=config.getint('diagnostics', 'log_backups', fallback=LOG_BACKUPS),
+                encoding="utf-8")
+        except OSError as e:
+            print("Could not open timing log:", e)
+        else:
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _log.addHandler(handler)
+            _log.setLevel(logging.INFO)
+    mode = os.environ.get("PPC_PROFILE") or config.get('diagnostics', 'profile', fallback='off')
+    if mode.lower() not in ('', 'off', 'no'):
+        start_profiling(mode.lower())
+
+
+def record(phase, seconds, **fields):
+    """Log one finished phase; fields are sizes, paths, counts, error text."""
+    if not _log.handlers:
+        return
+    if fields.get("bytes") and seconds > 0:
+        fields["bytes_per_sec"] = round(fields["bytes"] / seconds)
+    entry = {"ts": round(time.time(), 3), "session": SESSION, "script": _state["script"],
+             "thread": threading.current_thread().name, "phase": phase,
+             "seconds": round(seconds, 6), **fields}
+    _log.info(json.dumps(entry, default=str))
+
+
+@contextmanager
+def span(phase, **fields):
+    """Time the with-block as `phase`; it may add fields (e.g. bytes) to the yielded dict."""
+    t0 = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record(phase, time.perf_counter() - t0, **fields)
+
+
+def timed_future(phase, fut, **fields):
+    """Record `phase` when fut (started now) completes; returns fut."""
+    t0 = time.perf_counter()
+
+    def done(f):
+        if f.cancelled():
+            fields["error"] = "cancelled"
+        elif f.exception() is not None:
+            e = f.exception()
+            fields["error"] = f"{type(e).__name__}: {e}"
+        record(phase, time.perf_counter() - t0, **fields)
+    fut.add_done_callback(done)
+    return fut
+
+
+# --- Profiling ---
+class StackSampler:
+    """Counts the stacks of every thread every SAMPLE_INTERVAL seconds.
+
+    write() produces collapsed stacks ("thread;outer;...;inner count"), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    where = f"{os.path.basename(code.co_filename)}:{frame.f_lineno}"
+                    stack.append(f"{code.co_name} ({where})")
+                    frame = frame.f_back
+                self.counts[(names.get(ident, str(ident)), *reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.counts.most_common():
+                f.write(";".join(s.replace(";", ",") for s in stack) + f" {n}\n")
+
+
+def start_profiling(mode):
+    if _state["profiler"] is not None:
+        return
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif mode == "sample":
+        profiler = StackSampler().start()
+    else:
+        print(f"Unknown profile mode {mode!r}; expected one of {', '.join(PROFILE_MODES)}")
+        return
+    _state["profiler"] = (mode, profiler, time.perf_counter())
+    atexit.register(stop_profiling)
+
+
+def stop_profiling():
+    """Write the session profile to the logs folder; returns its path (None if not profiling)."""
+    if _state["profiler"] is None:
+        return None
+    mode, profiler, t0 = _state["profiler"]
+    _state["profiler"] = None
+    ext = ".prof" if mode == "cprofile" else ".folded"
+    path = os.path.join(cache_dir('logs'), f"profile-{SESSION}{ext}")
+    try:
+        if mode == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(path)   # python -m pstats <file>, or snakeviz
+        else:
+            profiler.stop()
+            profiler.write(path)
+    except OSError as e:
+        print("Could not write profile:", e)
+        return None
+    print("Profile written to", path)
+    record("profile", time.perf_counter() - t0, mode=mode, path=path)
+    return path
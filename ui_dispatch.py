@@ -0,0 +1,163 @@
+"""Hands work from worker threads to the Tk thread, in batches.
+
+Tk may only be touched from the thread running mainloop. Workers post()
+callables to a queue that the Tk loop drains on a timer, many per hop,
+and get a concurrent.futures.Future of the result; nothing off the Tk
+thread ever calls into Tk, not even after(). in_background() is the other
+direction: slow work (share I/O) runs on a pool and its result comes back
+through the queue.
+
+The drain tick doubles as a heartbeat: a watchdog thread notices when it
+stops for longer than stall_ms, captures what the Tk thread is doing, and
+the stall is reported (and logged as a `ui_stall` phase) once the loop
+runs again.
+"""
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import timing
+
+DRAIN_MS = 15          # how often the Tk loop picks up posted work
+DRAIN_BUDGET = 0.02    # seconds of posted work run per tick before yielding to Tk
+STALL_MS = 500         # main-thread blocks longer than this are reported
+
+
+class Dispatcher:
+    """Queue of callables run on the Tk thread; see the module docstring.
+
+    Create it on the Tk thread, then start() it; stop() before the root is
+    destroyed cancels whatever is still queued for the Tk thread and waits
+    for background work (e.g. releasing a reservation) to finish.
+    """
+
+    def __init__(self, root, drain_ms=DRAIN_MS, stall_ms=STALL_MS, workers=4):
+        self.root = root
+        self.drain_ms = drain_ms
+        self.stall = stall_ms / 1000
+        self.queue = queue.SimpleQueue()
+        self.tk_thread = threading.current_thread()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-worker")
+        self.pending = None     # after() id of the next drain
+        self.beat = time.monotonic()
+        self.stalled = None     # stack of the Tk thread, captured mid-stall
+        self.stalls = 0
+        self.batches = 0
+        self.posted = 0
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(target=self._watch, name="ui-watchdog", daemon=True)
+
+    def start(self):
+        self.beat = time.monotonic()
+        self.pending = self.root.after(self.drain_ms, self._drain)
+        self.watchdog.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.pending is not None:
+            try:
+                self.root.after_cancel(self.pending)
+            except Exception:
+                pass   # root already gone
+            self.pending = None
+        while True:
+            try:
+                fut, _, _, _ = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            fut.cancel()
+        self.executor.shutdown(wait=True)
+
+    def on_tk_thread(self):
+        return threading.current_thread() is self.tk_thread
+
+    # --- from any thread ---
+    def post(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for the Tk thread; returns a Future of its result."""
+        fut = Future()
+        if self.stopped.is_set():
+            fut.cancel()
+            return fut
+        self.queue.put((fut, fn, args, kwargs))
+        self.posted += 1
+        return fut
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on the Tk thread and return its result (directly when already there)."""
+        if self.on_tk_thread():
+            return fn(*args, **kwargs)
+        return self.post(fn, *args, **kwargs).result()
+
+    def wrap(self, fn):
+        # a callback for worker threads that posts instead of running
+        return lambda *args, **kwargs: self.post(fn, *args, **kwargs)
+
+    def main_thread(self, factory):
+        # factory (e.g. a Tk class) callable from any thread, built on the Tk thread
+        return lambda *args, **kwargs: self.call(factory, *args, **kwargs)
+
+    def in_background(self, fn, *args, then=None):
+        """Run fn(*args) on a worker; then(future) runs on the Tk thread once it is done.
+
+        then is dropped if the dispatcher has been stopped by then, so work
+        whose result must be acted on (e.g. a reservation) has to finish
+        before stop().
+        """
+        fut = self.executor.submit(fn, *args)
+        if then is not None:
+            fut.add_done_callback(lambda f: self.post(then, f))
+        return fut
+
+    # --- Tk thread ---
+    def _drain(self):
+        now = time.monotonic()
+        late = now - self.beat - self.drain_ms / 1000
+        if late > self.stall:
+            self._report(late)
+        self.beat = now
+        deadline = now + DRAIN_BUDGET
+        ran = 0
+        while time.monotonic() < deadline:
+            try:
+                fut, fn, args, kwargs = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                traceback.print_exc()
+            ran += 1
+        if ran:
+            self.batches += 1
+        if not self.stopped.is_set():
+            # straight back when work is left over, after Tk had its turn
+            self.pending = self.root.after(1 if not self.queue.empty() else self.drain_ms,
+                                           self._drain)
+
+    def _report(self, seconds):
+        self.stalls += 1
+        where = self.stalled or []
+        self.stalled = None
+        print(f"UI thread blocked for {seconds * 1000:.0f} ms"
+              + (f" in {where[-1]}" if where else ""))
+        timing.record("ui_stall", seconds, stack=where)
+
+    # --- watchdog thread ---
+    def _watch(self):
+        ident = self.tk_thread.ident
+        while not self.stopped.wait(self.stall / 2):
+            if self.stalled is None and time.monotonic() - self.beat > self.stall:
+                # catch the Tk thread in the act; reported when it comes back
+                frame = sys._current_frames().get(ident)
+                if frame is not None:
+                    self.stalled = [f"{fs.name} ({fs.filename}:{fs.lineno})"
+                                    for fs in traceback.extract_stack(frame)]